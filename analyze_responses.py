@@ -1,7 +1,49 @@
 import re
+import sys
 from collections import defaultdict
+from results_store import ResultsStore
+
+def is_no_info(answer):
+    return answer.lower().startswith("i don't") or "don't have" in answer.lower()
+
+def analyze_run(records):
+    """Analyze the records of a run loaded from the results store"""
+    analysis = {
+        'total_questions': 0,
+        'answered': 0,
+        'no_info': 0,
+        'sections': defaultdict(lambda: {'total': 0, 'answered': 0, 'no_info': 0}),
+        'sources': defaultdict(int),
+        'common_gaps': [],
+        'i_dont_responses': []
+    }
+    
+    for record in records:
+        section = record['section_name'] or record['section']
+        answer = record['answer'] or ''
+        analysis['total_questions'] += 1
+        analysis['sections'][section]['total'] += 1
+        
+        # Failed questions count as lacking information
+        if record['error'] is not None or is_no_info(answer):
+            analysis['no_info'] += 1
+            analysis['sections'][section]['no_info'] += 1
+            analysis['i_dont_responses'].append({
+                'section': section,
+                'question': record['question'],
+                'answer': answer or f"[Not answered: {record['error']}]"
+            })
+        else:
+            analysis['answered'] += 1
+            analysis['sections'][section]['answered'] += 1
+        
+        for source in record['sources'] or []:
+            analysis['sources'][source['source']] += 1
+    
+    return analysis
 
 def analyze_responses(file_path):
+    """Analyze a text report written before runs were kept in the results store"""
     with open(file_path, 'r') as f:
         content = f.read()
 
@@ -38,7 +80,7 @@ def analyze_responses(file_path):
                             analysis['sections'][current_section]['total'] += 1
 
                             # Check for "I don't" responses
-                            if answer.lower().startswith("i don't") or "don't have" in answer.lower():
+                            if is_no_info(answer):
                                 analysis['no_info'] += 1
                                 analysis['sections'][current_section]['no_info'] += 1
                                 analysis['i_dont_responses'].append({
@@ -118,6 +160,13 @@ def print_analysis_report(analysis):
         print(f"  - {section}: {ratio*100:.1f}% missing information")
 
 if __name__ == "__main__":
-    file_path = "security_questionnaire_responses_2024-10-28 20-39-36.txt"
-    analysis = analyze_responses(file_path)
+    # Usage: analyze_responses.py [RUN_ID | legacy_report.txt]; defaults to the latest run
+    target = sys.argv[1] if len(sys.argv) > 1 else None
+    if target and target.endswith('.txt'):
+        analysis = analyze_responses(target)
+    else:
+        records = ResultsStore().load_run(target)
+        if not records:
+            sys.exit("No runs found in the results store")
+        analysis = analyze_run(records)
     print_analysis_report(analysis)
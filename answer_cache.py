@@ -0,0 +1,164 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import faiss
+import numpy as np
+
+from context_compression import tokenize
+
+logger = logging.getLogger(__name__)
+
+HNSW_NEIGHBORS = 32
+# Nearest approved questions checked per lookup; the best one that passes every check wins
+LOOKUP_CANDIDATES = 5
+
+
+def distinguishing_terms(question: str, approved_question: str) -> Set[str]:
+    """Content words only one of two questions has; empty when they ask the same thing in other words
+
+    Sibling questions ("... accessing SPII data" / "... sharing of SPII data",
+    "access to the site" / "access to the computer room") embed almost
+    identically, so a high similarity alone would hand one the other's answer.
+    """
+    return set(tokenize(question)) ^ set(tokenize(approved_question))
+
+
+class ApprovedAnswerCache:
+    """Approximate nearest-neighbour cache over questions whose answers reviewers approved.
+
+    Approved answers come from ResponseDatabase (the Yes and Apply buttons in
+    ui.py). A new question gets an approved answer back directly only if its
+    embedding is at least `threshold` cosine similar to the approved question
+    and the two have the same content words (distinguishing_terms), so a
+    sibling question that differs in one word never reuses the other's answer.
+    """
+
+    def __init__(self, db, embed_documents: Callable[[List[str]], List[List[float]]],
+                 embed_query: Callable[[str], List[float]], threshold: float = 0.95):
+        self.db = db
+        self.embed_documents = embed_documents
+        self.embed_query = embed_query
+        self.threshold = threshold
+        self.index = None
+        self.entries: List[Dict[str, Any]] = []
+        # Normalized embedding of every loaded question, reused when the approvals change
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.lexical_rejections = 0
+
+    def load(self, entries: Optional[List[Dict[str, Any]]] = None) -> int:
+        """(Re)build the index from the approved responses in the database, embedding only new questions"""
+        if entries is None:
+            entries = [dict(row) for row in self.db.get_approved_responses()]
+        if not entries:
+            with self._lock:
+                self.index, self.entries, self._vectors = None, [], {}
+            return 0
+
+        # Only questions that were not loaded before are embedded
+        with self._lock:
+            known = dict(self._vectors)
+        missing = [question for question in dict.fromkeys(e["question"] for e in entries) if question not in known]
+        if missing:
+            embedded = np.array(self.embed_documents(missing), dtype="float32")
+            faiss.normalize_L2(embedded)
+            known.update(zip(missing, embedded))
+
+        vectors = np.stack([known[e["question"]] for e in entries])
+        index = faiss.IndexHNSWFlat(vectors.shape[1], HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT)
+        index.add(vectors)
+
+        with self._lock:
+            self.index, self.entries = index, entries
+            self._vectors = {e["question"]: known[e["question"]] for e in entries}
+        logger.info(f"Loaded {len(entries)} approved answers into the answer cache ({len(missing)} newly embedded)")
+        return len(entries)
+
+    def refresh(self) -> bool:
+        """Reload if approvals were added, changed or withdrawn since the last load; True if it reloaded
+
+        Only the questions of added or changed approvals are embedded again.
+        """
+        entries = [dict(row) for row in self.db.get_approved_responses()]
+        with self._lock:
+            loaded = {(entry["id"], entry["updated_at"]) for entry in self.entries}
+        if {(entry["id"], entry["updated_at"]) for entry in entries} == loaded:
+            return False
+        self.load(entries)
+        return True
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """Return the approved answer for a sufficiently similar question, if any"""
+        with self._lock:
+            self.lookups += 1
+            index, entries = self.index, self.entries
+        if index is None:
+            return None
+
+        vector = np.array([self.embed_query(question)], dtype="float32")
+        faiss.normalize_L2(vector)
+        scores, ids = index.search(vector, min(LOOKUP_CANDIDATES, len(entries)))
+        entry = None
+        for score, idx in zip(scores[0].tolist(), ids[0].tolist()):
+            if idx < 0 or score < self.threshold:
+                break
+            differing = distinguishing_terms(question, entries[idx]["question"])
+            if not differing:
+                entry = entries[idx]
+                break
+            logger.info(f"Approved answer not reused at similarity {score:.3f}: the questions differ in {sorted(differing)}")
+            with self._lock:
+                self.lexical_rejections += 1
+        if entry is None:
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return {
+            "query": question,
+            "result": entry["answer"],
+            "source_documents": [],
+            "cache_hit": {
+                "response_id": entry["id"],
+                "approved_question": entry["question"],
+                "similarity": round(score, 4),
+                "approved_at": entry["updated_at"],
+                "sources": entry["sources"],
+            }
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "approved_answers": len(self.entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "lexical_rejections": self.lexical_rejections,
+                "threshold": self.threshold,
+            }
+
+
+if __name__ == "__main__":
+    # No two different questions of the questionnaire may reuse each other's approved answer
+    from itertools import combinations
+
+    from vision import SecurityQuestionnaire
+
+    questions = SecurityQuestionnaire().questions
+    text = {key: question for section in questions.values() for key, question in section.items()}
+    for first, second in [("spii_access", "spii_sharing"), ("spii_access", "spii_storage"),
+                          ("spii_sharing", "spii_storage"), ("site_access", "computer_room_access")]:
+        differing = distinguishing_terms(text[first], text[second])
+        assert differing, f"{first} and {second} would share an approved answer"
+        print(f"{first} / {second}: miss, differ in {sorted(differing)}")
+    clashes = [
+        (first, second) for first, second in combinations(text, 2)
+        if text[first].strip().lower() != text[second].strip().lower()
+        and not distinguishing_terms(text[first], text[second])
+    ]
+    assert not clashes, f"different questions with the same content words: {clashes}"
+    print(f"All {len(text)} questions are told apart from each other")
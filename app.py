@@ -1,12 +1,18 @@
 import streamlit as st
 from vision import SecurityQuestionnaire, process_rag_queries
 from datetime import datetime
+import time
 
 # Initialize session state for tracking verifications and feedback
 if 'verifications' not in st.session_state:
     st.session_state.verifications = {}
 if 'feedback' not in st.session_state:
     st.session_state.feedback = {}
+if 'results' not in st.session_state:
+    st.session_state.results = {}
+
+# Answer placeholder of every question block, filled in as answers arrive
+answer_slots = {}
 
 def display_ai_disclaimer():
     st.markdown("""
@@ -47,15 +53,41 @@ def display_verification_status(q_key: str):
             </div>
         """, unsafe_allow_html=True)
 
+def format_sources(item: dict) -> str:
+    sources = [
+        f"{source['source']}" + (f" (p. {source['page']})" if source.get('page') else "")
+        for source in item['sources']
+    ]
+    return f"Sources: {', '.join(sources) or 'none'} · answered in {item['elapsed']:.1f}s"
+
+def show_answer(slot, item: dict):
+    """Render a streamed answer into its question block"""
+    answer = item['answer']
+    with slot.container():
+        if 'error' in answer:
+            st.error(f"Could not answer this question: {answer['error']}")
+            return
+        st.markdown(answer['result'])
+        st.caption(format_sources(item))
+
 def question_response_block(section: str, q_key: str, question: str):
     """Display a question with its response and verification controls"""
     with st.expander(f"Q: {question}", expanded=True):
         # AI Response Section
         st.markdown("### 🤖 AI-Generated Response")
-        # Placeholder for answer display
-        st.text_area("Answer", value="", key=f"answer_{q_key}")
+        slot = st.empty()
+        answer_slots[(section, q_key)] = slot
+        item = st.session_state.results.get((section, q_key))
+        if item and 'error' not in item['answer']:
+            with slot.container():
+                st.text_area("Answer", value=item['answer']['result'], key=f"answer_{section}_{q_key}")
+                st.caption(format_sources(item))
+        elif item:
+            show_answer(slot, item)
+        else:
+            slot.caption("Not answered yet")
         # Add feedback options
-        st.radio("Rate the answer quality:", ["Excellent", "Good", "Needs Improvement"], key=f"rating_{q_key}")
+        st.radio("Rate the answer quality:", ["Excellent", "Good", "Needs Improvement"], key=f"rating_{section}_{q_key}")
 
 # Load questionnaire
 questionnaire = SecurityQuestionnaire()
@@ -72,10 +104,19 @@ for i, section in enumerate(questionnaire.questions.keys()):
 
 # Add a button to process all questions
 if st.button("Process All Questions"):
-    results = process_rag_queries(questionnaire)
-    st.session_state.results = results
-    st.success("Processing complete!")
-
-# Display results if available
-if 'results' in st.session_state:
-    st.write(st.session_state.results) 
\ No newline at end of file
+    st.session_state.results = {}
+    total = sum(len(questions) for questions in questionnaire.questions.values())
+    progress = st.progress(0.0, text="Loading documents...")
+    started = time.perf_counter()
+    first_answer = None
+    # Answers are shown in their question blocks as soon as each one completes
+    for item in process_rag_queries(questionnaire):
+        if first_answer is None:
+            first_answer = time.perf_counter() - started
+        st.session_state.results[(item['section'], item['question_key'])] = item
+        show_answer(answer_slots[(item['section'], item['question_key'])], item)
+        answered = len(st.session_state.results)
+        progress.progress(answered / total, text=f"Answered {answered} of {total} questions")
+    elapsed = time.perf_counter() - started
+    first = f"{first_answer:.1f}s" if first_answer is not None else "n/a"
+    st.success(f"Processing complete! First answer after {first}, all {total} in {elapsed:.1f}s")
@@ -0,0 +1,150 @@
+import json
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DB_PATH = "checkpoints.db"
+
+
+def serialize_answer(answer: Dict[str, Any]) -> str:
+    """JSON encoding of a pipeline answer; source documents keep their text and metadata"""
+    data = dict(answer)
+    data["source_documents"] = [
+        {"page_content": doc.page_content, "metadata": doc.metadata}
+        for doc in answer.get("source_documents", [])
+    ]
+    return json.dumps(data, default=str)
+
+
+def deserialize_answer(payload: str) -> Dict[str, Any]:
+    data = json.loads(payload)
+    data["source_documents"] = [Document(**doc) for doc in data.get("source_documents", [])]
+    return data
+
+
+class CheckpointStore:
+    """Durable per-question answers of questionnaire runs, keyed by run id, section and question key.
+
+    Every answer is committed as soon as it completes, so an interrupted run
+    loses at most the questions that were in flight. Failed answers are not
+    stored and are retried when the run is resumed. Pass wal=False for a
+    database on a filesystem shared between machines, where WAL does not work;
+    it switches a database that was opened in WAL mode before back to the
+    rollback journal.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_DB_PATH, wal: bool = True):
+        self.path = path
+        self.wal = wal
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self.create_tables()
+
+    def create_tables(self):
+        with self._lock:
+            cursor = self.conn.cursor()
+            # The journal mode is stored in the database file, so a database
+            # another process opened in WAL mode has to be switched back
+            mode = cursor.execute(f"PRAGMA journal_mode={'WAL' if self.wal else 'DELETE'}").fetchone()[0]
+            if not self.wal and mode.lower() == "wal":
+                logger.warning(f"Checkpoint database {self.path} is still in WAL mode; "
+                               f"another connection holds it open")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    index_version TEXT,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS run_answers (
+                    run_id TEXT NOT NULL,
+                    section TEXT NOT NULL,
+                    question_key TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (run_id, section, question_key),
+                    FOREIGN KEY (run_id) REFERENCES runs (run_id)
+                )
+            ''')
+            self.conn.commit()
+
+    def start_run(self, run_id: str, index_version: Optional[str] = None):
+        """Register a run, or reopen it when resuming
+
+        Answers checkpointed against a different index_version (other
+        documents) are discarded, so a resumed run never reuses them.
+        """
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT index_version FROM runs WHERE run_id = ?', (run_id,))
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute('INSERT INTO runs (run_id, index_version) VALUES (?, ?)', (run_id, index_version))
+            else:
+                if index_version and row[0] != index_version:
+                    logger.warning(f"Run {run_id} was started against different documents; "
+                                   f"discarding its checkpointed answers")
+                    cursor.execute('DELETE FROM run_answers WHERE run_id = ?', (run_id,))
+                cursor.execute('''
+                    UPDATE runs SET status = 'running', index_version = COALESCE(?, index_version),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE run_id = ?
+                ''', (index_version, run_id))
+            self.conn.commit()
+
+    def save_answer(self, run_id: str, section: str, question_key: str, question: str, answer: Dict[str, Any]):
+        if "error" in answer:
+            return
+        with self._lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO run_answers (run_id, section, question_key, question, answer)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (run_id, section, question_key, question, serialize_answer(answer)))
+            self.conn.commit()
+
+    def completed_answers(self, run_id: str,
+                          questions: Optional[Dict[str, Dict[str, str]]] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Answers already completed for a run, as {section: {question_key: answer}}
+
+        With `questions` ({section: {question_key: question}}, the questionnaire
+        as it is now), only answers to questions still asked with the same
+        wording are returned; a question that was removed or reworded since
+        it was answered is answered again.
+        """
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT section, question_key, question, answer FROM run_answers WHERE run_id = ?
+            ''', (run_id,))
+            rows = cursor.fetchall()
+        completed = {}
+        for section, question_key, question, payload in rows:
+            if questions is not None:
+                current = questions.get(section, {}).get(question_key)
+                if current != question:
+                    if current is not None:
+                        logger.info(f"Question {section}/{question_key} was reworded since it was answered; "
+                                    f"answering it again")
+                    continue
+            try:
+                completed.setdefault(section, {})[question_key] = deserialize_answer(payload)
+            except (ValueError, TypeError) as e:
+                logger.error(f"Discarding unreadable checkpoint for {section}/{question_key}: {str(e)}")
+        return completed
+
+    def finish_run(self, run_id: str, status: str = "completed"):
+        with self._lock:
+            self.conn.execute('''
+                UPDATE runs SET status = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE run_id = ?
+            ''', (status, run_id))
+            self.conn.commit()
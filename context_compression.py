@@ -0,0 +1,237 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+from langchain.retrievers.document_compressors.base import BaseDocumentCompressor
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional, fall back to a character estimate
+    _encoding = None
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+(?:[.!?]+|\n|$)")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from",
+    "has", "have", "how", "in", "is", "it", "of", "on", "or", "the", "this", "to",
+    "what", "when", "where", "which", "who", "will", "with", "you", "your", "any",
+    "if", "so", "there", "their", "these", "those", "such", "e", "g", "etc"
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of prompt tokens in a piece of text"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+def tokenize(text: str) -> List[str]:
+    return [w for w in WORD_PATTERN.findall(text.lower()) if w not in STOPWORDS]
+
+
+def split_sentences(text: str) -> List[Tuple[int, str]]:
+    """Split text into (offset, sentence) pairs, offsets relative to the text"""
+    sentences = []
+    for match in SENTENCE_PATTERN.finditer(text):
+        sentence = match.group(0).strip()
+        if sentence:
+            sentences.append((match.start(), sentence))
+    return sentences
+
+
+class CompressionStats:
+    """Thread-safe counters for the compression stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.chunks_in = 0
+        self.chunks_out = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.seconds = 0.0
+
+    def record(self, chunks_in, chunks_out, tokens_in, tokens_out, seconds):
+        with self._lock:
+            self.calls += 1
+            self.chunks_in += chunks_in
+            self.chunks_out += chunks_out
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+            self.seconds += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            saved = self.tokens_in - self.tokens_out
+            return {
+                "calls": self.calls,
+                "chunks_in": self.chunks_in,
+                "chunks_out": self.chunks_out,
+                "context_tokens_in": self.tokens_in,
+                "context_tokens_out": self.tokens_out,
+                "context_tokens_saved": saved,
+                "saved_pct": round(100.0 * saved / self.tokens_in, 1) if self.tokens_in else 0.0,
+                "compression_seconds": round(self.seconds, 3),
+            }
+
+
+def remove_overlaps(documents: Sequence[Document]) -> List[Document]:
+    """Trim text shared between chunks of the same page using their start_index offsets.
+
+    Documents keep their retrieval order; only the spans of a chunk that a
+    higher-ranked chunk from the same page already covers are removed. A
+    chunk with a covered span in its middle becomes one document per
+    remaining piece, each with the start_index of its own text.
+    Compressed documents hold sentences that need not be contiguous, so
+    their start_index is no span; only their repeated sentences are removed.
+    """
+    return [doc for _, doc in trim_overlaps(documents)]
+
+
+def trim_overlaps(documents: Sequence[Document]) -> List[Tuple[int, Document]]:
+    """remove_overlaps, with the index in `documents` each trimmed document came from"""
+    covered: Dict[Tuple[Any, Any], List[Tuple[int, int]]] = {}
+    seen_sentences: Dict[Tuple[Any, Any], set] = {}
+    result = []
+
+    for origin, doc in enumerate(documents):
+        if doc.metadata.get("compressed"):
+            seen = seen_sentences.setdefault((doc.metadata.get("source"), doc.metadata.get("page")), set())
+            sentences = [sentence for _, sentence in split_sentences(doc.page_content) if sentence not in seen]
+            seen.update(sentences)
+            if sentences:
+                result.append((origin, Document(page_content=" ".join(sentences), metadata=dict(doc.metadata))))
+            continue
+
+        start = doc.metadata.get("start_index")
+        if start is None:
+            result.append((origin, doc))
+            continue
+
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        end = start + len(doc.page_content)
+
+        # Subtract every span an earlier chunk already contributed
+        pieces = [(start, end)]
+        for covered_start, covered_end in covered.get(key, []):
+            remaining = []
+            for piece_start, piece_end in pieces:
+                if covered_end <= piece_start or covered_start >= piece_end:
+                    remaining.append((piece_start, piece_end))
+                    continue
+                if piece_start < covered_start:
+                    remaining.append((piece_start, covered_start))
+                if covered_end < piece_end:
+                    remaining.append((covered_end, piece_end))
+            pieces = remaining
+        covered.setdefault(key, []).append((start, end))
+
+        # One document per remaining piece: joined pieces would no longer be one span from start_index
+        for piece_start, piece_end in pieces:
+            raw = doc.page_content[piece_start - start:piece_end - start]
+            text = raw.strip()
+            if text:
+                metadata = dict(doc.metadata, start_index=piece_start + len(raw) - len(raw.lstrip()))
+                result.append((origin, Document(page_content=text, metadata=metadata)))
+
+    return result
+
+
+class ExtractiveContextCompressor(BaseDocumentCompressor):
+    """Local, model-free compression of retrieved chunks before generation.
+
+    Overlapping spans between chunks are removed first, then only the sentences
+    that score highest against the question (BM25-style term weighting over the
+    retrieved sentences) are kept, in their original document order.
+    """
+
+    max_sentences: int = 6
+    min_score: float = 0.0
+    stats: Optional[Any] = None
+
+    def compress_documents(self, documents: Sequence[Document], query: str, callbacks=None) -> List[Document]:
+        started = time.perf_counter()
+        tokens_in = sum(estimate_tokens(d.page_content) for d in documents)
+
+        deduped = remove_overlaps(documents)
+        compressed = self._select_sentences(deduped, query)
+
+        if self.stats is not None:
+            self.stats.record(
+                chunks_in=len(documents),
+                chunks_out=len(compressed),
+                tokens_in=tokens_in,
+                tokens_out=sum(estimate_tokens(d.page_content) for d in compressed),
+                seconds=time.perf_counter() - started,
+            )
+        return compressed
+
+    def _select_sentences(self, documents: List[Document], query: str) -> List[Document]:
+        query_terms = set(tokenize(query))
+        if not query_terms or not documents:
+            return documents
+
+        candidates = []  # (doc_index, offset, sentence, terms)
+        for i, doc in enumerate(documents):
+            for offset, sentence in split_sentences(doc.page_content):
+                candidates.append((i, offset, sentence, Counter(tokenize(sentence))))
+
+        if not candidates:
+            return documents
+
+        # Inverse document frequency over the retrieved sentences
+        n = len(candidates)
+        doc_freq = Counter()
+        for _, _, _, terms in candidates:
+            doc_freq.update(set(terms) & query_terms)
+        idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()}
+
+        avg_len = sum(sum(terms.values()) for *_, terms in candidates) / n or 1.0
+        k1, b = 1.2, 0.75
+        scored = []
+        for idx, (doc_i, offset, sentence, terms) in enumerate(candidates):
+            length = sum(terms.values())
+            score = 0.0
+            for term in query_terms:
+                tf = terms.get(term, 0)
+                if tf:
+                    score += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_len))
+            scored.append((score, idx))
+
+        selected = sorted(
+            idx for score, idx in sorted(scored, reverse=True)[:self.max_sentences]
+            if score > self.min_score
+        )
+        if not selected:
+            # Nothing matched the question lexically, keep the deduplicated chunks
+            return documents
+
+        kept: Dict[int, List[Tuple[int, str]]] = {}
+        for idx in selected:
+            doc_i, offset, sentence, _ = candidates[idx]
+            kept.setdefault(doc_i, []).append((offset, sentence))
+
+        compressed = []
+        for doc_i, sentences in kept.items():
+            doc = documents[doc_i]
+            metadata = dict(doc.metadata)
+            if metadata.get("start_index") is not None:
+                metadata["start_index"] = metadata["start_index"] + sentences[0][0]
+            metadata["compressed"] = True
+            compressed.append(Document(
+                page_content=" ".join(sentence for _, sentence in sentences),
+                metadata=metadata
+            ))
+        return compressed
@@ -1,14 +1,71 @@
+import atexit
+import logging
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime
 
-class ResponseDatabase:
-    def __init__(self):
-        self.conn = sqlite3.connect('responses.db', check_same_thread=False)
-        self.create_tables()
-    
-    def create_tables(self):
-        cursor = self.conn.cursor()
-        
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'responses.db'
+
+# Writes queued while a transaction commits are committed together in the next one
+WRITE_BATCH_SIZE = 100
+BUSY_TIMEOUT_SECONDS = 30
+
+# Schema migrations, applied in order to databases whose PRAGMA user_version
+# is below their version. Append new ones; never edit an applied migration.
+MIGRATIONS = [
+    (1, [
+        # get_response_history(ies): filter on question_id, newest first
+        "CREATE INDEX IF NOT EXISTS idx_responses_question_created ON responses (question_id, created_at DESC, id DESC)",
+        # get_latest_responses (and so get_approved_responses): MAX(id) per question_id
+        "CREATE INDEX IF NOT EXISTS idx_responses_question_response ON responses (question_id, response, id)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_response ON feedback (response_id)",
+    ]),
+]
+
+# Stays below SQLite's limit on bound parameters per statement
+MAX_QUERY_PARAMETERS = 500
+
+# Reviewer responses that approve an answer
+APPROVED_RESPONSES = ('Yes', 'Applied')
+
+class ConnectionManager:
+    """Connections to one database file, shared by everything in the process.
+
+    The database is opened in WAL mode, so readers never wait for the
+    writer. Reads use one connection per thread. Writes are queued and
+    return a Future at once; a single writer thread commits everything
+    queued so far in one transaction, so concurrent writers neither
+    serialize on commits nor run into "database is locked".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.stats = {"writes": 0, "transactions": 0, "failed_writes": 0}
+
+        writer = self._connect()
+        self.create_tables(writer)
+        self.migrate(writer)
+        self._thread = threading.Thread(target=self._run, args=(writer,), name="response-db-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Durable at every checkpoint; commits no longer wait for an fsync each
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def create_tables(self, conn):
+        cursor = conn.cursor()
+
         # Create responses table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS responses (
@@ -22,7 +79,7 @@ class ResponseDatabase:
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
+
         # Create feedback table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS feedback (
@@ -34,40 +91,247 @@ class ResponseDatabase:
                 FOREIGN KEY (response_id) REFERENCES responses (id)
             )
         ''')
-        
-        self.conn.commit()
-    
+
+        conn.commit()
+
+    def migrate(self, conn):
+        """Bring an existing database up to the latest schema version"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, statements in MIGRATIONS:
+            if target <= version:
+                continue
+            with conn:
+                for statement in statements:
+                    conn.execute(statement)
+                # PRAGMA does not take parameters; target is an int from MIGRATIONS
+                conn.execute(f"PRAGMA user_version = {int(target)}")
+            version = target
+
+    def reader(self):
+        """This thread's read connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def write(self, sql, params=()):
+        """Queue a write; the Future resolves to the row id once it is committed"""
+        future = Future()
+        with self._lock:
+            self._pending += 1
+        self._queue.put((sql, params, future))
+        return future
+
+    def flush(self, timeout=None):
+        """Wait until every write queued so far is committed"""
+        barrier = Future()
+        with self._lock:
+            self._pending += 1
+        self._queue.put((None, None, barrier))
+        barrier.result(timeout)
+
+    def writer_alive(self):
+        return self._thread.is_alive()
+
+    def has_pending_writes(self):
+        with self._lock:
+            return self._pending > 0
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, pending=self._pending)
+
+    def _run(self, conn):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(conn, batch)
+            with self._lock:
+                self._pending -= len(batch)
+
+    def _commit(self, conn, batch):
+        writes = [(sql, params, future) for sql, params, future in batch if sql is not None]
+        try:
+            with conn:
+                results = [conn.execute(sql, params).lastrowid for sql, params, _ in writes]
+            transactions = 1
+        except sqlite3.Error as e:
+            # Commit the writes one by one so a bad write fails on its own
+            logger.error(f"Grouped commit of {len(writes)} writes failed, retrying them one by one: {str(e)}")
+            results = []
+            for sql, params, _ in writes:
+                try:
+                    with conn:
+                        results.append(conn.execute(sql, params).lastrowid)
+                except sqlite3.Error as write_error:
+                    results.append(write_error)
+            transactions = len(writes)
+
+        failed = 0
+        for (sql, params, future), result in zip(writes, results):
+            if isinstance(result, Exception):
+                failed += 1
+                # Callers may never look at the Future, so every lost write is logged here
+                logger.error(f"Write failed and was not committed: {str(result)}; "
+                             f"statement: {' '.join(sql.split())}; parameters: {params!r}")
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        for sql, _, future in batch:
+            if sql is None:
+                future.set_result(None)
+        with self._lock:
+            self.stats["writes"] += len(writes)
+            self.stats["transactions"] += transactions
+            self.stats["failed_writes"] += failed
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(path=DB_PATH):
+    """The connection manager shared by every ResponseDatabase on `path` in this process"""
+    with _managers_lock:
+        if path not in _managers:
+            _managers[path] = ConnectionManager(path)
+        return _managers[path]
+
+
+@atexit.register
+def _flush_all():
+    with _managers_lock:
+        managers = list(_managers.values())
+    for manager in managers:
+        try:
+            manager.flush(timeout=BUSY_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error(f"Could not flush pending writes to {manager.path}: {str(e)}")
+
+
+class ResponseDatabase:
+    """Reviewer responses and feedback. Cheap to construct: connections are shared per process.
+
+    Writes return a Future (of the new row id, for inserts) and are
+    committed in the background; reads first wait for queued writes, so a
+    rerun always sees the click that caused it. Callers that report a
+    write as saved, or need the row id (e.g. as a feedback response_id),
+    must wait on the Future with .result(timeout) first.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.db = get_connection_manager(path)
+
+    def _read(self, sql, params=(), row_factory=None):
+        if self.db.has_pending_writes():
+            try:
+                self.db.flush(timeout=BUSY_TIMEOUT_SECONDS)
+            except FutureTimeoutError:
+                # A stalled or dead writer must not hang every reader with it
+                logger.error(f"Queued writes to {self.db.path} were not committed within {BUSY_TIMEOUT_SECONDS}s "
+                             f"(writer thread alive: {self.db.writer_alive()}); the read was not run")
+                raise
+        cursor = self.db.reader().cursor()
+        cursor.row_factory = row_factory
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    def flush(self, timeout=None):
+        self.db.flush(timeout)
+
     def save_response(self, question_id, question, answer, response, sources=None):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+        """Queue a response; returns a Future of its row id"""
+        return self.db.write('''
             INSERT INTO responses (question_id, question, answer, response, sources)
             VALUES (?, ?, ?, ?, ?)
         ''', (question_id, question, answer, response, sources))
-        self.conn.commit()
-        return cursor.lastrowid
-    
+
     def update_response(self, response_id, response):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            UPDATE responses 
+        """Queue a change of a saved response; the Future fails if the update does"""
+        return self.db.write('''
+            UPDATE responses
             SET response = ?, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
         ''', (response, response_id))
-        self.conn.commit()
-    
+
     def save_feedback(self, response_id, feedback_type, feedback_text=None):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+        """Queue feedback on a response; response_id is the row id a save_response Future resolved to"""
+        return self.db.write('''
             INSERT INTO feedback (response_id, feedback_type, feedback_text)
             VALUES (?, ?, ?)
         ''', (response_id, feedback_type, feedback_text))
-        self.conn.commit()
-    
+
+    def get_latest_responses(self, since=None):
+        """Latest response to every question, whatever it was; only those updated at or after `since` if given"""
+        return self._read('''
+            SELECT r.id, r.question_id, r.question, r.answer, r.response, r.sources, r.updated_at
+            FROM responses r
+            WHERE r.id = (SELECT MAX(id) FROM responses WHERE question_id = r.question_id)
+            AND (? IS NULL OR r.updated_at >= ?)
+        ''', (since, since), row_factory=sqlite3.Row)
+
+    def get_approved_responses(self, since=None):
+        """Questions whose latest response approves the answer (Yes or Applied); a later No withdraws it"""
+        return [row for row in self.get_latest_responses(since) if row["response"] in APPROVED_RESPONSES]
+
     def get_response_history(self, question_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM responses 
+        return self._read('''
+            SELECT * FROM responses
             WHERE question_id = ?
-            ORDER BY created_at DESC
+            ORDER BY created_at DESC, id DESC
         ''', (question_id,))
-        return cursor.fetchall() 
\ No newline at end of file
+
+    def get_response_histories(self, question_ids):
+        """Response history of many questions at once, as {question_id: rows newest first}
+
+        Rows are the same as get_response_history's; questions without
+        responses map to an empty list.
+        """
+        question_ids = list(dict.fromkeys(question_ids))
+        histories = {question_id: [] for question_id in question_ids}
+        for i in range(0, len(question_ids), MAX_QUERY_PARAMETERS):
+            chunk = question_ids[i:i + MAX_QUERY_PARAMETERS]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = self._read(f'''
+                SELECT * FROM responses
+                WHERE question_id IN ({placeholders})
+                ORDER BY question_id, created_at DESC, id DESC
+            ''', chunk)
+            for row in rows:
+                histories[row[1]].append(row)
+        return histories
+
+    def summary(self):
+        return self.db.summary()
+
+
+if __name__ == "__main__":
+    # Several reviewers clicking at once: time seen by the clicking thread vs. commits issued
+    import os
+    import tempfile
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    path = os.path.join(tempfile.mkdtemp(), "responses.db")
+    db = ResponseDatabase(path)
+    latencies = []
+
+    def click(i):
+        started = time.perf_counter()
+        db.save_response(f"q{i % 110}", f"Question {i % 110}?", "Answer", "Yes")
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(click, range(2000)))
+    db.flush()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    history = db.get_response_histories(f"q{i}" for i in range(110))
+    print(f"2000 writes from 8 threads committed in {elapsed:.2f}s; per-click latency "
+          f"p50 {latencies[1000] * 1e6:.0f}us p99 {latencies[1980] * 1e6:.0f}us; "
+          f"{sum(len(rows) for rows in history.values())} rows read back; {db.summary()}")
@@ -0,0 +1,229 @@
+import csv
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from report_renderer import StreamingDocxWriter
+from results_store import ResultsStore
+
+logger = logging.getLogger(__name__)
+
+EXPORTS_DIR = os.getenv("RAG_EXPORTS_DIR", "exports")
+# How long an artifact of an older run version is kept after it was last served
+ARTIFACT_GRACE_SECONDS = 600
+
+# Format -> MIME type of the downloaded artifact
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+EXPORT_COLUMNS = [
+    ("Section", "section_name"),
+    ("Question Key", "question_key"),
+    ("Question", "question"),
+    ("Answer", "answer"),
+    ("Error", "error"),
+    ("Sources", "sources"),
+    ("Tier", "tier"),
+    ("Elapsed (s)", "elapsed_seconds"),
+    ("Completed At", "completed_at"),
+]
+
+
+def export_row(record: Dict[str, Any]) -> List[Any]:
+    row = []
+    for _, field in EXPORT_COLUMNS:
+        value = record.get(field)
+        if field == "sources":
+            value = "; ".join(
+                f"{source['source']} (Page {source['page']})" if source.get("page") else source["source"]
+                for source in value or []
+            )
+        row.append(value)
+    return row
+
+
+def write_csv(path: str, records: Iterable[Dict[str, Any]], title: str):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow([heading for heading, _ in EXPORT_COLUMNS])
+        for record in records:
+            writer.writerow(export_row(record))
+
+
+def write_xlsx(path: str, records: Iterable[Dict[str, Any]], title: str):
+    # openpyxl's write-only mode streams rows to disk instead of building the sheet in memory
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title[:31])
+    sheet.freeze_panes = "A2"
+    sheet.append([heading for heading, _ in EXPORT_COLUMNS])
+    for record in records:
+        sheet.append(export_row(record))
+    workbook.save(path)
+
+
+def write_docx(path: str, records: Iterable[Dict[str, Any]], title: str):
+    writer = StreamingDocxWriter(path, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    try:
+        section = None
+        for record in records:
+            if record["section"] != section:
+                section = record["section"]
+                writer.section(record.get("section_name") or section)
+            writer.record(record)
+    finally:
+        writer.close()
+
+
+EXPORT_WRITERS = {"csv": write_csv, "xlsx": write_xlsx, "docx": write_docx}
+
+
+def ordering_key(questions: Optional[Dict[str, Dict[str, str]]]) -> str:
+    """Short id of the row order `questions` gives, so differently ordered artifacts are cached apart"""
+    if not questions:
+        return "answered"
+    order = [[section, list(section_questions)] for section, section_questions in questions.items()]
+    return hashlib.sha1(json.dumps(order).encode("utf-8")).hexdigest()[:8]
+
+
+class ExportService:
+    """Builds downloadable artifacts of a run straight from the results store.
+
+    Artifacts are cached on disk as <directory>/<run_id>/<version>-<order>.<format>,
+    where the version changes whenever the run's records do and the order
+    identifies the questionnaire order of the rows (ordering_key), so repeated
+    downloads of an unchanged run are served from disk. Generation runs on a
+    background thread; concurrent requests for the same artifact share one
+    generation.
+    """
+
+    def __init__(self, store: Optional[ResultsStore] = None, directory: str = EXPORTS_DIR, max_workers: int = 2):
+        self.store = store or ResultsStore()
+        self.directory = directory
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export")
+        self._in_flight: Dict[str, Future] = {}
+        # Reentrant: a generation that already finished runs its done callback inside submit()
+        self._lock = threading.RLock()
+        self.stats = {"cache_hits": 0, "generated": 0, "failures": 0}
+
+    def artifact_path(self, run_id: str, version: str, fmt: str,
+                      questions: Optional[Dict[str, Dict[str, str]]] = None) -> str:
+        return os.path.join(self.directory, run_id, f"{version}-{ordering_key(questions)}.{fmt}")
+
+    def cached(self, run_id: str, fmt: str, questions: Optional[Dict[str, Dict[str, str]]] = None) -> Optional[str]:
+        """Path of the artifact for the run as it is now, if it was generated before"""
+        path = self.artifact_path(run_id, self.store.run_version(run_id), fmt, questions)
+        return path if os.path.exists(path) else None
+
+    def _generate(self, run_id: str, version: str, fmt: str, questions: Optional[Dict[str, Dict[str, str]]]) -> str:
+        path = self.artifact_path(run_id, version, fmt, questions)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        exported = 0
+
+        def records():
+            # Streamed from the store a section at a time, never the whole run at once
+            nonlocal exported
+            for record in self.store.iter_run(run_id, questions):
+                exported += 1
+                yield record
+
+        # Written under a temporary name so a half-written file is never served
+        partial = f"{path}.{threading.get_ident()}.partial"
+        try:
+            EXPORT_WRITERS[fmt](partial, records(), f"Run {run_id}")
+            os.replace(partial, path)
+        except Exception:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        self._remove_stale(os.path.dirname(path), version, fmt)
+        logger.info(f"Exported {exported} answers of run {run_id} to {path}")
+        return path
+
+    def _remove_stale(self, directory: str, version: str, fmt: str):
+        """Delete artifacts of older versions of the run that nobody was handed recently"""
+        # Serving an artifact touches it (submit), so one another session was just
+        # given stays until that session has had ample time to read it
+        cutoff = time.time() - ARTIFACT_GRACE_SECONDS
+        for name in os.listdir(directory):
+            if not name.endswith(f".{fmt}") or name.startswith(f"{version}-"):
+                continue
+            stale = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(stale) < cutoff:
+                    os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+    def submit(self, run_id: str, fmt: str, questions: Optional[Dict[str, Dict[str, str]]] = None) -> Future:
+        """Future of the artifact path; already generated artifacts resolve immediately.
+
+        `questions` ({section: {key: question}}) orders the rows as in the
+        questionnaire; otherwise they are grouped by section in answer order.
+        """
+        if fmt not in EXPORT_WRITERS:
+            raise ValueError(f"Unsupported export format {fmt!r}; expected one of {sorted(EXPORT_WRITERS)}")
+        version = self.store.run_version(run_id)
+        path = self.artifact_path(run_id, version, fmt, questions)
+        with self._lock:
+            if os.path.exists(path):
+                self.stats["cache_hits"] += 1
+                try:
+                    # Marks it as in use, so cleanup after a newer version keeps it a while longer
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+                future = Future()
+                future.set_result(path)
+                return future
+            key = path
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self._generate, run_id, version, fmt, questions)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda done: self._finished(key, done))
+        return future
+
+    def _finished(self, key: str, future: Future):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if future.exception() is not None:
+                self.stats["failures"] += 1
+                logger.error(f"Export {key} failed: {str(future.exception())}")
+            else:
+                self.stats["generated"] += 1
+
+    def export(self, run_id: str, fmt: str, questions: Optional[Dict[str, Dict[str, str]]] = None) -> str:
+        """Path of the artifact, generating it if needed"""
+        return self.submit(run_id, fmt, questions).result()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._in_flight))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export a questionnaire run from the results store")
+    parser.add_argument("format", choices=sorted(EXPORT_WRITERS))
+    parser.add_argument("--run-id", help="run to export (default: the latest run)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    service = ExportService()
+    run_id = args.run_id or service.store.latest_run_id()
+    if run_id is None:
+        print("No runs in the results store")
+    else:
+        print(service.export(run_id, args.format))
@@ -0,0 +1,210 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+from run_report import percentile
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a model request does not complete within its overall deadline"""
+
+
+class Attempt:
+    """Deadline of one attempt at a request, and whether the request gave up on it"""
+
+    def __init__(self, deadline_at: float):
+        self.deadline_at = deadline_at
+        self.abandoned = threading.Event()
+
+    def remaining(self) -> float:
+        return self.deadline_at - time.perf_counter()
+
+    def expired(self) -> bool:
+        return self.abandoned.is_set() or self.remaining() <= 0
+
+
+_current_attempt: contextvars.ContextVar = contextvars.ContextVar("generation_attempt", default=None)
+
+
+def current_attempt() -> Optional[Attempt]:
+    """The attempt the calling code runs in, if it was started by a GenerationClient"""
+    return _current_attempt.get()
+
+
+class LatencyTracker:
+    """Rolling window of observed latencies"""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._values = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._values.append(seconds)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._values)
+
+    def percentile(self, pct: float) -> float:
+        with self._lock:
+            return percentile(list(self._values), pct)
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            values = list(self._values)
+        return {
+            "samples": len(values),
+            "p50": round(percentile(values, 50), 2),
+            "p95": round(percentile(values, 95), 2),
+            "p99": round(percentile(values, 99), 2),
+        }
+
+
+class GenerationClient:
+    """Runs model calls with an overall per-request deadline and optional hedging.
+
+    When hedging is enabled and enough latencies have been observed, a duplicate
+    request is fired once the primary has been running longer than the
+    `hedge_percentile` latency, and whichever finishes first wins. Losing calls
+    are cancelled if they have not started yet. Calls already running are
+    marked abandoned (see current_attempt): the rate limiter neither retries
+    them nor gives them a new slot, and model requests made in them time out
+    at the request's deadline. They are counted until they return.
+    """
+
+    def __init__(self, name: str, deadline: float = 90.0, hedge: bool = True, hedge_percentile: float = 95,
+                 min_samples: int = 20, max_workers: int = 16):
+        self.name = name
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"gen-{name}")
+        self._lock = threading.Lock()
+        self.primary_latency = LatencyTracker()
+        self.effective_latency = LatencyTracker()
+        self.calls = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.deadlines_exceeded = 0
+        self.abandoned = 0
+        self.abandoned_in_flight = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Delay before firing a hedge, or None while hedging is off or not calibrated"""
+        if not self.hedge or len(self.primary_latency) < self.min_samples:
+            return None
+        return self.primary_latency.percentile(self.hedge_percentile)
+
+    def _submit(self, attempt: Attempt, fn: Callable[..., Any], *args, **kwargs):
+        # Run in a copy of the caller's context so callback handlers (token usage) still apply
+        context = contextvars.copy_context()
+        context.run(_current_attempt.set, attempt)
+        future = self._executor.submit(context.run, fn, *args, **kwargs)
+        future.attempt = attempt
+        return future
+
+    def _abandon(self, future):
+        future.attempt.abandoned.set()
+        if future.cancel() or future.done():
+            return
+        with self._lock:
+            self.abandoned += 1
+            self.abandoned_in_flight += 1
+        future.add_done_callback(lambda _: self._abandoned_returned())
+
+    def _abandoned_returned(self):
+        with self._lock:
+            self.abandoned_in_flight -= 1
+
+    def call(self, fn: Callable[..., Any], *args, deadline: Optional[float] = None, **kwargs) -> Any:
+        started = time.perf_counter()
+        deadline_at = started + (deadline or self.deadline)
+        with self._lock:
+            self.calls += 1
+
+        primary = self._submit(Attempt(deadline_at), fn, *args, **kwargs)
+        # Primary latency is recorded even if the call loses, giving the unhedged distribution
+        primary.add_done_callback(
+            lambda f: f.cancelled() or self.primary_latency.add(time.perf_counter() - started)
+        )
+        futures = [primary]
+
+        delay = self.hedge_delay()
+        first_wait = deadline_at - time.perf_counter()
+        if delay is not None:
+            first_wait = min(first_wait, delay)
+        done, _ = wait(futures, timeout=max(0.0, first_wait))
+
+        if not done and delay is not None and time.perf_counter() < deadline_at:
+            futures.append(self._submit(Attempt(deadline_at), fn, *args, **kwargs))
+            with self._lock:
+                self.hedges_fired += 1
+            logger.info(f"[{self.name}] Hedging request after {delay:.2f}s")
+
+        winner = None
+        pending = list(futures)
+        while pending:
+            remaining = deadline_at - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, not_done = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            pending = list(not_done)
+            successful = [f for f in done if f.exception() is None]
+            if successful:
+                winner = successful[0]
+                break
+            if not pending:
+                winner = next(iter(done))  # every attempt failed, surface the error
+                break
+
+        for future in futures:
+            if future is not winner:
+                self._abandon(future)
+
+        if winner is None:
+            with self._lock:
+                self.deadlines_exceeded += 1
+            raise DeadlineExceeded(f"{self.name} request exceeded its {deadline or self.deadline:.0f}s deadline")
+
+        if winner is not primary:
+            with self._lock:
+                self.hedge_wins += 1
+        self.effective_latency.add(time.perf_counter() - started)
+        return winner.result()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {
+                "calls": self.calls,
+                "hedges_fired": self.hedges_fired,
+                "hedge_wins": self.hedge_wins,
+                "deadlines_exceeded": self.deadlines_exceeded,
+                "abandoned": self.abandoned,
+                "abandoned_in_flight": self.abandoned_in_flight,
+            }
+        counters["before_hedging"] = self.primary_latency.summary()
+        counters["after_hedging"] = self.effective_latency.summary()
+        return counters
+
+
+if __name__ == "__main__":
+    # Simulate a heavy-tailed backend to compare latency before and after hedging
+    logging.basicConfig(level=logging.WARNING)
+
+    def stub_model(_):
+        time.sleep(random.uniform(0.01, 0.03) if random.random() > 0.05 else random.uniform(0.3, 0.6))
+        return "ok"
+
+    client = GenerationClient("stub", deadline=2.0, hedge=True, min_samples=20)
+    for i in range(300):
+        client.call(stub_model, i)
+    print(client.summary())
@@ -0,0 +1,388 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_PATH = os.getenv("RAG_JOB_QUEUE", "jobs.db")
+JOB_RESULTS_DIR = os.getenv("RAG_JOB_RESULTS", "job_results")
+# Apart from vision.main's checkpoints.db, which is opened in WAL mode
+JOB_CHECKPOINT_DB_PATH = "job_checkpoints.db"
+LEASE_SECONDS = 120
+POLL_SECONDS = 5
+# How often a running job publishes its progress
+PROGRESS_SECONDS = 2
+MAX_ATTEMPTS = 3
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def new_run_id() -> str:
+    return f"job-{uuid.uuid4().hex[:12]}"
+
+
+class JobQueue:
+    """SQLite queue of questionnaire jobs, shared by worker processes through a common file.
+
+    A worker claims a job by taking a lease on it and must renew the lease
+    while it runs. Jobs whose lease expired (the worker crashed or lost the
+    filesystem) are handed to the next worker that asks, up to
+    `max_attempts` claims. Uses SQLite's default rollback journal instead of
+    WAL, since WAL does not work across machines on a network filesystem.
+    Lease times are wall-clock, so the machines' clocks must roughly agree.
+    Checkpoints, results and reports of jobs are kept next to the queue
+    database (see shared_path), so a worker that reclaims a job on another
+    machine resumes from the answers the previous one checkpointed.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self.create_tables()
+
+    def shared_path(self, name: str) -> str:
+        """Path of a file or folder that lives next to the queue database"""
+        return os.path.join(os.path.dirname(os.path.abspath(self.path)), name)
+
+    @contextmanager
+    def _transaction(self):
+        # One short-lived connection per operation, safe across processes and threads
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def create_tables(self):
+        with self._transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    docs_path TEXT NOT NULL,
+                    questionnaire TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    worker_id TEXT,
+                    lease_expires_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL DEFAULT 3,
+                    questions_done INTEGER NOT NULL DEFAULT 0,
+                    questions_total INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)')
+            # Queues created before progress reporting lack this column
+            columns = {row["name"] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if "progress" not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN progress TEXT')
+            # Ids restart at 1 in every queue database, so runs are named by a random id instead
+            if "run_id" not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN run_id TEXT')
+
+    def submit(self, docs_path: str, questionnaire: Dict[str, Any], max_attempts: int = MAX_ATTEMPTS) -> int:
+        """Queue a (docs folder, questionnaire) job; questionnaire is a SecurityQuestionnaire.to_dict() snapshot"""
+        total = sum(len(questions) for questions in questionnaire["questions"].values())
+        with self._transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO jobs (docs_path, questionnaire, max_attempts, questions_total, run_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (os.path.abspath(docs_path), json.dumps(questionnaire), max_attempts, total, new_run_id()))
+            return cursor.lastrowid
+
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Lease the oldest queued job, or one whose worker's lease expired"""
+        now = time.time()
+        with self._transaction() as conn:
+            # Expired leases that used up their attempts are failed instead of retried forever
+            conn.execute('''
+                UPDATE jobs SET status = 'failed', error = 'Lease expired after the last attempt',
+                    worker_id = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts
+            ''', (now,))
+            row = conn.execute('''
+                SELECT * FROM jobs
+                WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?)
+                ORDER BY id LIMIT 1
+            ''', (now,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == RUNNING:
+                logger.warning(f"Reclaiming job {row['id']} from worker {row['worker_id']} whose lease expired")
+            job = dict(row)
+            # Jobs queued before run ids were stored get theirs on first claim
+            job["run_id"] = job["run_id"] or new_run_id()
+            conn.execute('''
+                UPDATE jobs SET status = 'running', worker_id = ?, lease_expires_at = ?, attempts = attempts + 1,
+                    run_id = ?, started_at = COALESCE(started_at, CURRENT_TIMESTAMP), updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (worker_id, now + lease_seconds, job["run_id"], row["id"]))
+        job["questionnaire"] = json.loads(job["questionnaire"])
+        return job
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float = LEASE_SECONDS,
+                  questions_done: Optional[int] = None, progress: Optional[Dict[str, Any]] = None) -> bool:
+        """Renew the lease and record progress; False if the job is no longer leased to this worker"""
+        with self._transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET lease_expires_at = ?, questions_done = COALESCE(?, questions_done),
+                    progress = COALESCE(?, progress), updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+            ''', (time.time() + lease_seconds, questions_done, json.dumps(progress) if progress else None,
+                  job_id, worker_id))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET status = 'completed', result = ?, lease_expires_at = NULL,
+                    questions_done = questions_total, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+            ''', (json.dumps(result), job_id, worker_id))
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Give a failed job back to the queue, or fail it for good once out of attempts"""
+        with self._transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                    error = ?, worker_id = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+            ''', (error, job_id, worker_id))
+            return cursor.rowcount == 1
+
+    def status(self, job_id: Optional[int] = None, job_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """Jobs (all of them, one, or the given ids) with their progress and result decoded"""
+        with self._transaction() as conn:
+            query = '''
+                SELECT id, run_id, docs_path, status, worker_id, attempts, max_attempts, questions_done, questions_total,
+                    lease_expires_at, progress, result, error, created_at, started_at, updated_at
+                FROM jobs
+            '''
+            if job_id is not None:
+                rows = conn.execute(query + ' WHERE id = ?', (job_id,)).fetchall()
+            elif job_ids is not None:
+                placeholders = ", ".join("?" for _ in job_ids)
+                rows = conn.execute(query + f' WHERE id IN ({placeholders}) ORDER BY id', list(job_ids)).fetchall()
+            else:
+                rows = conn.execute(query + ' ORDER BY id').fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["progress"] = json.loads(job["progress"]) if job["progress"] else {}
+            job["result"] = json.loads(job["result"]) if job["result"] else None
+            jobs.append(job)
+        return jobs
+
+
+STAGES = ("files", "chunks", "questions")
+
+
+def estimate_eta(job: Dict[str, Any], now: Optional[float] = None) -> Optional[float]:
+    """Seconds until the job's current stage finishes, extrapolated from its rate so far"""
+    progress = job.get("progress") or {}
+    stage = progress.get("stage")
+    current = progress.get(stage) if stage else None
+    if not current or not current["done"]:
+        return None
+    elapsed = (now or time.time()) - current["started"]
+    return elapsed / current["done"] * (current["total"] - current["done"])
+
+
+class JobHeartbeat:
+    """Renews a job's lease from a background thread and publishes its progress.
+
+    update() is the progress callback process_rag_queries expects; progress
+    is written every PROGRESS_SECONDS, the lease renewed with it.
+    """
+
+    def __init__(self, queue: JobQueue, job_id: int, worker_id: str, lease_seconds: float = LEASE_SECONDS):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.questions_done = 0
+        # {"stage": current stage, stage: {"done", "total", "started"}} for each stage reached so far
+        self.progress: Dict[str, Any] = {}
+        self._progress_lock = threading.Lock()
+        self._last_update = time.time()
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id}", daemon=True)
+
+    def update(self, stage: str, done: int, total: int):
+        with self._progress_lock:
+            if stage not in self.progress:
+                # A stage starts when the previous one reported last, not at its own first report
+                self.progress[stage] = {"done": 0, "total": total, "started": self._last_update}
+            self.progress[stage].update(done=done, total=total)
+            self._last_update = time.time()
+            self.progress["stage"] = stage
+            if stage == "questions":
+                self.questions_done = done
+
+    def _run(self):
+        while not self._stop.wait(min(self.lease_seconds / 3, PROGRESS_SECONDS)):
+            try:
+                with self._progress_lock:
+                    progress = json.loads(json.dumps(self.progress))
+                if not self.queue.heartbeat(self.job_id, self.worker_id, self.lease_seconds, self.questions_done,
+                                            progress):
+                    logger.error(f"Lost the lease on job {self.job_id}, stopping it")
+                    self.lost.set()
+                    return
+            except sqlite3.Error as e:
+                # A missed heartbeat is fine as long as a later one lands before the lease expires
+                logger.error(f"Heartbeat for job {self.job_id} failed: {str(e)}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_job(queue: JobQueue, job: Dict[str, Any], worker_id: str, lease_seconds: float = LEASE_SECONDS,
+            pipeline_factory: Optional[Callable[..., Any]] = None):
+    """Answer one claimed job; pipeline_factory(docs_path, progress, job_id) may supply an already indexed pipeline"""
+    from vision import SecurityQuestionnaire, RunReport, process_rag_queries
+    from checkpoint_store import CheckpointStore
+    from results_store import RESULTS_DIR, ResultsStore
+    from report_renderer import ReportRenderer
+
+    questionnaire = SecurityQuestionnaire.from_dict(job["questionnaire"])
+    # The job's run id is stored with it, so a reclaimed job resumes from the previous worker's checkpoints
+    run_id = job["run_id"]
+    report = RunReport()
+    store = ResultsStore(queue.shared_path(RESULTS_DIR))
+    checkpoints = CheckpointStore(queue.shared_path(JOB_CHECKPOINT_DB_PATH), wal=False)
+    errors = 0
+
+    with JobHeartbeat(queue, job["id"], worker_id, lease_seconds) as heartbeat:
+        renderer = ReportRenderer(questionnaire, output_dir=queue.shared_path(os.path.join(JOB_RESULTS_DIR, run_id)))
+        try:
+            pipeline = pipeline_factory(job["docs_path"], heartbeat.update, run_id) if pipeline_factory else None
+            answers = process_rag_queries(questionnaire, docs_path=job["docs_path"], run_id=run_id, report=report,
+                                          pipeline=pipeline, store=store, progress=heartbeat.update,
+                                          checkpoints=checkpoints)
+            for item in answers:
+                errors += "error" in item["answer"]
+                renderer.submit(item["record"])
+                if heartbeat.lost.is_set():
+                    # The worker that reclaims the job renders its own reports
+                    answers.close()
+                    return
+            paths = renderer.close()
+        finally:
+            # A failed or abandoned job leaves no half-written reports and no blocked writer thread
+            renderer.abort()
+        result = {"run_id": run_id, "results": store.jsonl_path(run_id), "txt": paths["txt"], "docx": paths["docx"],
+                  "errors": errors, "report": report.as_dict()}
+        if not queue.complete(job["id"], worker_id, result):
+            logger.error(f"Job {job['id']} finished after its lease was lost; its results are not recorded")
+
+
+def run_worker(queue: JobQueue, worker_id: Optional[str] = None, lease_seconds: float = LEASE_SECONDS,
+               poll_seconds: float = POLL_SECONDS, once: bool = False,
+               pipeline_factory: Optional[Callable[..., Any]] = None, wake: Optional[threading.Event] = None):
+    """Claim and run jobs until stopped; with once=True, stop when the queue is empty
+
+    Setting `wake` makes an idle worker poll right away instead of after poll_seconds.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    logger.info(f"Worker {worker_id} polling {queue.path}")
+    while True:
+        job = queue.claim(worker_id, lease_seconds)
+        if job is None:
+            if once:
+                return
+            if wake is None:
+                time.sleep(poll_seconds)
+            elif wake.wait(poll_seconds):
+                wake.clear()
+            continue
+
+        logger.info(f"Worker {worker_id} running job {job['id']} ({job['docs_path']}, attempt {job['attempts'] + 1})")
+        try:
+            run_job(queue, job, worker_id, lease_seconds, pipeline_factory)
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}")
+            queue.fail(job["id"], worker_id, str(e))
+
+
+def print_status(jobs: List[Dict[str, Any]]):
+    for job in jobs:
+        progress = f"{job['questions_done']}/{job['questions_total']}"
+        line = f"#{job['id']:<4} {job['status']:<9} {progress:>9}  attempts {job['attempts']}/{job['max_attempts']}  {job['docs_path']}"
+        stage = job["progress"].get("stage")
+        if job["status"] == RUNNING and stage:
+            eta = estimate_eta(job)
+            line += f"  {stage} {job['progress'][stage]['done']}/{job['progress'][stage]['total']}"
+            line += f" (ETA {eta:.0f}s)" if eta is not None else ""
+        if job["worker_id"]:
+            line += f"  worker {job['worker_id']}"
+        if job["error"]:
+            line += f"  error: {job['error']}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue questionnaire jobs and run them on any number of workers")
+    parser.add_argument("--db", default=JOB_QUEUE_PATH, help="queue database, on a filesystem all workers share")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="queue a docs folder to be answered")
+    submit.add_argument("docs_path")
+    submit.add_argument("--questionnaire", help="JSON file with 'sections' and 'questions' (default: built-in)")
+    submit.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+
+    worker = commands.add_parser("worker", help="claim and run jobs")
+    worker.add_argument("--worker-id")
+    worker.add_argument("--lease", type=float, default=LEASE_SECONDS, help="lease length in seconds")
+    worker.add_argument("--once", action="store_true", help="exit once the queue is empty")
+
+    status = commands.add_parser("status", help="show job progress")
+    status.add_argument("job_id", nargs="?", type=int)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    queue = JobQueue(args.db)
+
+    if args.command == "submit":
+        if args.questionnaire:
+            with open(args.questionnaire, encoding="utf-8") as f:
+                questionnaire = json.load(f)
+        else:
+            from vision import SecurityQuestionnaire
+            questionnaire = SecurityQuestionnaire().to_dict()
+        job_id = queue.submit(args.docs_path, questionnaire, args.max_attempts)
+        print(f"Queued job {job_id}")
+    elif args.command == "worker":
+        run_worker(queue, args.worker_id, args.lease, once=args.once)
+    else:
+        print_status(queue.status(args.job_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from database import APPROVED_RESPONSES
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_BASE_PATH = os.getenv("RAG_KNOWLEDGE_BASE", "knowledge_base.db")
+SEARCH_LIMIT = 20
+# bm25 column weights: a match in the question counts more than one in the answer
+QUESTION_WEIGHT = 4.0
+ANSWER_WEIGHT = 1.0
+
+RUN = "run"
+APPROVED = "approved"
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(text: str) -> Optional[str]:
+    """FTS5 query matching every word of free text, the last one as a prefix (search as you type)"""
+    tokens = _TOKEN.findall(text)
+    if not tokens:
+        return None
+    # Quoted, so words like AND, NOT or NEAR and characters like - or : are not FTS syntax
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class KnowledgeBase:
+    """Full-text index (SQLite FTS5, BM25 ranking) over every past questionnaire answer.
+
+    Holds the answers of every finished run in the results store and the
+    approved answer of every question in ResponseDatabase whose latest
+    response is still an approval.
+    refresh() indexes only runs and approvals it has not seen yet, so it is
+    cheap enough to call on every rerun.
+    """
+
+    def __init__(self, path: str = KNOWLEDGE_BASE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.create_tables()
+
+    def create_tables(self):
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5(
+                    question,
+                    answer,
+                    kind UNINDEXED,
+                    ref UNINDEXED,
+                    section_name UNINDEXED,
+                    sources UNINDEXED,
+                    updated_at UNINDEXED,
+                    tokenize = 'porter unicode61'
+                )
+            ''')
+            # What has been indexed so far, so refreshes only add what is new
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS indexed_runs (
+                    run_id TEXT PRIMARY KEY,
+                    version TEXT
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS indexed_approvals (
+                    question_id TEXT PRIMARY KEY,
+                    response_id INTEGER,
+                    updated_at TEXT
+                )
+            ''')
+            self.conn.commit()
+
+    def index_run(self, run_id: str, records: List[Dict[str, Any]], version: Optional[str] = None):
+        """(Re)index the answered questions of one run"""
+        rows = [
+            (
+                record["question"], record["answer"], RUN, run_id, record.get("section_name"),
+                ", ".join(source["source"] for source in record.get("sources") or []), record.get("completed_at"),
+            )
+            for record in records
+            if record.get("answer")
+        ]
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM entries WHERE kind = ? AND ref = ?", (RUN, run_id))
+            self.conn.executemany('''
+                INSERT INTO entries (question, answer, kind, ref, section_name, sources, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self.conn.execute("INSERT OR REPLACE INTO indexed_runs (run_id, version) VALUES (?, ?)", (run_id, version))
+        return len(rows)
+
+    def index_approved(self, responses) -> int:
+        """Index the latest responses (rows of ResponseDatabase.get_latest_responses); one entry per approved question
+
+        A question whose latest response is not an approval loses its entry.
+        """
+        indexed = 0
+        with self._lock, self.conn:
+            for response in responses:
+                question_id = str(response["question_id"])
+                self.conn.execute("DELETE FROM entries WHERE kind = ? AND ref = ?", (APPROVED, question_id))
+                # Recorded either way, so the refresh watermark moves past rejections too
+                self.conn.execute('''
+                    INSERT OR REPLACE INTO indexed_approvals (question_id, response_id, updated_at) VALUES (?, ?, ?)
+                ''', (question_id, response["id"], response["updated_at"]))
+                if response["response"] not in APPROVED_RESPONSES:
+                    continue
+                self.conn.execute('''
+                    INSERT INTO entries (question, answer, kind, ref, section_name, sources, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (response["question"], response["answer"], APPROVED, question_id, None,
+                      response["sources"], response["updated_at"]))
+                indexed += 1
+        return indexed
+
+    def refresh(self, store=None, db=None) -> Dict[str, int]:
+        """Index finished runs of a ResultsStore and approvals in a ResponseDatabase not indexed yet"""
+        added = {"runs": 0, "approvals": 0}
+        if store is not None:
+            with self._lock:
+                indexed = {row["run_id"]: row["version"] for row in self.conn.execute("SELECT * FROM indexed_runs")}
+            for run in store.list_runs():
+                if not run["finished_at"]:
+                    continue
+                # A resumed run is finished again, so this changes whenever its answers can have
+                version = f"{run['answers']}:{run['finished_at']}"
+                if indexed.get(run["run_id"]) != version:
+                    self.index_run(run["run_id"], store.load_run(run["run_id"]), version)
+                    added["runs"] += 1
+        if db is not None:
+            with self._lock:
+                since = self.conn.execute("SELECT MAX(updated_at) AS since FROM indexed_approvals").fetchone()["since"]
+                seen = {
+                    row["question_id"]: (row["response_id"], row["updated_at"])
+                    for row in self.conn.execute("SELECT * FROM indexed_approvals")
+                } if since else {}
+            changed = [
+                response for response in db.get_latest_responses(since=since)
+                if seen.get(str(response["question_id"])) != (response["id"], response["updated_at"])
+            ]
+            if changed:
+                added["approvals"] = self.index_approved(changed)
+        if added["runs"] or added["approvals"]:
+            logger.info(f"Knowledge base: indexed {added['runs']} runs and {added['approvals']} approved answers")
+        return added
+
+    def search(self, text: str, limit: int = SEARCH_LIMIT) -> List[Dict[str, Any]]:
+        """Best matches first, each with an answer snippet in which matches are **bold**"""
+        query = fts_query(text)
+        if query is None:
+            return []
+        with self._lock:
+            rows = self.conn.execute('''
+                SELECT question, kind, ref, section_name, sources, updated_at,
+                       snippet(entries, 1, '**', '**', '…', 24) AS snippet,
+                       bm25(entries, ?, ?) AS score
+                FROM entries
+                WHERE entries MATCH ?
+                ORDER BY score
+                LIMIT ?
+            ''', (QUESTION_WEIGHT, ANSWER_WEIGHT, query, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+if __name__ == "__main__":
+    import sys
+
+    from database import ResponseDatabase
+    from results_store import ResultsStore
+
+    logging.basicConfig(level=logging.INFO)
+    knowledge_base = KnowledgeBase()
+    started = time.perf_counter()
+    knowledge_base.refresh(ResultsStore(), ResponseDatabase())
+    print(f"Refreshed in {(time.perf_counter() - started) * 1000:.1f}ms, {knowledge_base.count()} entries")
+    query = " ".join(sys.argv[1:]) or "encryption"
+    started = time.perf_counter()
+    results = knowledge_base.search(query)
+    print(f"{len(results)} results for {query!r} in {(time.perf_counter() - started) * 1000:.1f}ms")
+    for result in results:
+        print(f"- [{result['kind']} {result['ref']}] {result['question']}\n  {result['snippet']}")
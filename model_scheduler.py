@@ -0,0 +1,142 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from generation_client import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Priority and job of the calls made by the current thread or task. Calls that
+# nobody marked as batch work are treated as interactive.
+_call_priority = contextvars.ContextVar("call_priority", default=(INTERACTIVE, None))
+
+
+@contextmanager
+def call_priority(priority: str, job_id: Optional[str] = None):
+    """Mark every model call made inside the block with a priority class and job"""
+    token = _call_priority.set((priority, job_id))
+    try:
+        yield
+    finally:
+        _call_priority.reset(token)
+
+
+class ModelCallScheduler:
+    """Hands out a fixed number of model-call slots by priority class.
+
+    Interactive requests always get the next free slot. Batch requests fill
+    the remaining capacity, served round-robin across batch jobs so one large
+    questionnaire cannot starve another.
+    """
+
+    def __init__(self, capacity: int, name: str = "model"):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.running = 0
+        self._condition = threading.Condition()
+        self._interactive = deque()
+        self._batch_jobs: "OrderedDict[Any, deque]" = OrderedDict()
+        self._wait = {INTERACTIVE: LatencyTracker(), BATCH: LatencyTracker()}
+        self._granted = {INTERACTIVE: 0, BATCH: 0}
+        self._max_depth = {INTERACTIVE: 0, BATCH: 0}
+
+    def set_capacity(self, capacity: int):
+        with self._condition:
+            self.capacity = max(1, capacity)
+            self._condition.notify_all()
+
+    def _depth(self, priority: str) -> int:
+        if priority == INTERACTIVE:
+            return len(self._interactive)
+        return sum(len(tickets) for tickets in self._batch_jobs.values())
+
+    def _next_ticket(self):
+        if self._interactive:
+            return self._interactive[0]
+        if self._batch_jobs:
+            return next(iter(self._batch_jobs.values()))[0]
+        return None
+
+    def _grant(self, ticket, priority: str, job_id):
+        if priority == INTERACTIVE:
+            self._interactive.popleft()
+            return
+        tickets = self._batch_jobs.pop(job_id)
+        tickets.popleft()
+        if tickets:
+            # Rotate the job to the back so other batch jobs get the next batch slot
+            self._batch_jobs[job_id] = tickets
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, job_id: Any = None):
+        if priority is None:
+            priority, job_id = _call_priority.get()
+        ticket = object()
+        queued_at = time.perf_counter()
+
+        with self._condition:
+            if priority == INTERACTIVE:
+                self._interactive.append(ticket)
+            else:
+                self._batch_jobs.setdefault(job_id, deque()).append(ticket)
+            self._max_depth[priority] = max(self._max_depth[priority], self._depth(priority))
+
+            while not (self.running < self.capacity and self._next_ticket() is ticket):
+                self._condition.wait()
+            self._grant(ticket, priority, job_id)
+            self.running += 1
+            self._granted[priority] += 1
+            # Another waiter may be next in line for a remaining free slot
+            self._condition.notify_all()
+
+        self._wait[priority].add(time.perf_counter() - queued_at)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.running -= 1
+                self._condition.notify_all()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._condition:
+            classes = {
+                priority: {
+                    "queued": self._depth(priority),
+                    "max_queue_depth": self._max_depth[priority],
+                    "granted": self._granted[priority],
+                }
+                for priority in (INTERACTIVE, BATCH)
+            }
+            running, capacity = self.running, self.capacity
+            batch_jobs = len(self._batch_jobs)
+        for priority, stats in classes.items():
+            stats["wait"] = self._wait[priority].summary()
+        return {"capacity": capacity, "running": running, "waiting_batch_jobs": batch_jobs, **classes}
+
+
+if __name__ == "__main__":
+    # Two bulk jobs saturate the slots while interactive queries arrive
+    from concurrent.futures import ThreadPoolExecutor
+
+    scheduler = ModelCallScheduler(capacity=4, name="stub")
+
+    def stub_call(priority, job_id=None):
+        with scheduler.slot(priority, job_id):
+            time.sleep(0.02)
+
+    with ThreadPoolExecutor(max_workers=48) as executor:
+        futures = [executor.submit(stub_call, BATCH, job) for job in ("job-a", "job-b") for _ in range(150)]
+        time.sleep(0.2)
+        for _ in range(20):
+            futures.append(executor.submit(stub_call, INTERACTIVE))
+            time.sleep(0.05)
+        for future in futures:
+            future.result()
+    print(scheduler.summary())
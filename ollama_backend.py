@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from model_scheduler import ModelCallScheduler
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama2")
+# Keep in line with the server's OLLAMA_NUM_PARALLEL so queued requests wait here, not in Ollama
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "2"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_REQUEST_TIMEOUT = 120.0
+
+
+class OllamaBackend:
+    """Pooled HTTP client for a local Ollama server with a fixed number of parallel slots.
+
+    Requests beyond `num_parallel` queue for a slot, with interactive requests
+    served before batch work. Every request passes
+    `keep_alive` so the model stays resident between queries, and liveness is
+    checked against the version endpoint instead of running a generation.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL,
+                 num_parallel: int = OLLAMA_NUM_PARALLEL, keep_alive: str = OLLAMA_KEEP_ALIVE,
+                 timeout: float = OLLAMA_REQUEST_TIMEOUT):
+        self.model = model
+        self.num_parallel = num_parallel
+        self.keep_alive = keep_alive
+        self.client = httpx.Client(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=num_parallel + 1, max_keepalive_connections=num_parallel + 1)
+        )
+        self.scheduler = ModelCallScheduler(num_parallel, name="ollama")
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "generation_seconds": 0.0}
+
+    def is_alive(self) -> bool:
+        """Cheap liveness probe that does not touch the model"""
+        try:
+            return self.client.get("/api/version", timeout=5.0).status_code == 200
+        except httpx.HTTPError as e:
+            logger.error(f"Ollama liveness probe failed: {str(e)}")
+            return False
+
+    def model_available(self) -> bool:
+        try:
+            response = self.client.get("/api/tags", timeout=5.0)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.error(f"Could not list Ollama models: {str(e)}")
+            return False
+        names = [m.get("name", "") for m in response.json().get("models", [])]
+        return any(name == self.model or name.split(":")[0] == self.model for name in names)
+
+    def is_loaded(self) -> bool:
+        """True if the model is currently resident in memory"""
+        try:
+            response = self.client.get("/api/ps", timeout=5.0)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            return False
+        return any(m.get("name", "").split(":")[0] == self.model.split(":")[0]
+                   for m in response.json().get("models", []))
+
+    def warm_up(self) -> float:
+        """Load the model ahead of the first query; returns the load time in seconds"""
+        started = time.perf_counter()
+        # A generate request without a prompt only loads the model
+        response = self.client.post("/api/generate", json={"model": self.model, "keep_alive": self.keep_alive})
+        response.raise_for_status()
+        elapsed = time.perf_counter() - started
+        logger.info(f"Ollama model {self.model} warmed up in {elapsed:.2f}s")
+        return elapsed
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, job_id: Any = None):
+        """Hold one of the parallel slots, queueing by priority while all are busy"""
+        with self.scheduler.slot(priority, job_id):
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self.stats["requests"] += 1
+                    self.stats["generation_seconds"] += time.perf_counter() - started
+
+    def generate(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        with self.slot():
+            response = self.client.post("/api/generate", json={
+                "model": self.model,
+                "prompt": prompt,
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": options or {},
+            })
+            response.raise_for_status()
+            return response.json()
+
+    def chat(self, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        with self.slot():
+            response = self.client.post("/api/chat", json={
+                "model": self.model,
+                "messages": messages,
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": options or {},
+            })
+            response.raise_for_status()
+            return response.json()
+
+    def stream_generate(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield Ollama's response chunks as they arrive; the slot is held until the generator finishes or is closed"""
+        return self._stream("/api/generate", {"prompt": prompt, "options": options or {}})
+
+    def stream_chat(self, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        return self._stream("/api/chat", {"messages": messages, "options": options or {}})
+
+    def _stream(self, path: str, payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        with self.slot():
+            with self.client.stream("POST", path, json=dict(
+                payload, model=self.model, stream=True, keep_alive=self.keep_alive
+            )) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    yield chunk
+                    if chunk.get("done"):
+                        return
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.stats["requests"]
+            generation_seconds = self.stats["generation_seconds"]
+        return {
+            "requests": requests,
+            "avg_generation_seconds": round(generation_seconds / requests, 3) if requests else 0.0,
+            "scheduler": self.scheduler.summary(),
+        }
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_ollama_backend() -> OllamaBackend:
+    """The Ollama backend shared by every caller in this process"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = OllamaBackend()
+        return _backend
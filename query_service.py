@@ -0,0 +1,270 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+SERVICE_HOST = os.getenv("RAG_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("RAG_SERVICE_PORT", "8765"))
+# How long the first question of a batch waits for others to join it
+BATCH_WAIT_SECONDS = 0.005
+MAX_BATCH_SIZE = 64
+
+
+class MicroBatcher:
+    """Collects items submitted from many threads into batches for one bulk call.
+
+    The first item of a batch waits at most `max_wait` seconds for others to
+    arrive; a batch is flushed early once it reaches `max_batch` items.
+    `process_batch` receives the items in order and must return one result
+    per item.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_wait: float = BATCH_WAIT_SECONDS,
+                 max_batch: int = MAX_BATCH_SIZE, name: str = "batcher"):
+        self.process_batch = process_batch
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._thread = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+            try:
+                results = list(self.process_batch([item for item, _ in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name} returned {len(results)} results for a batch of {len(batch)}")
+            except Exception as e:
+                logger.error(f"{self.name} batch of {len(batch)} failed: {str(e)}")
+                # Every request of the batch gets the error; none is left waiting
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "queued": self._queue.qsize(),
+            }
+
+
+class QueryService:
+    """Answers questions over a SecurityRAG engine, micro-batching retrieval across concurrent requests"""
+
+    def __init__(self, engine, max_wait: float = BATCH_WAIT_SECONDS, max_batch: int = MAX_BATCH_SIZE):
+        self.engine = engine
+        self.retrieval = MicroBatcher(engine.retrieve_many, max_wait=max_wait, max_batch=max_batch, name="retrieval")
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="query-service")
+
+    def answer(self, question: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        answer = self.engine.cached_answer(question)
+        if answer is None:
+            documents = self.retrieval.submit(question).result()
+            answer = self.engine.answer_with_documents(question, documents)
+        return {
+            "question": question,
+            "answer": answer["result"],
+            "tier": answer.get("tier"),
+            "sources": [
+                {"source": doc.metadata.get("source"), "page": doc.metadata.get("page")}
+                for doc in answer.get("source_documents", [])
+            ],
+            "elapsed": round(time.perf_counter() - started, 3),
+        }
+
+    def answer_many(self, questions: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Answer {key: question}; all questions join the same retrieval batches"""
+        futures = {key: self._executor.submit(self.answer, question) for key, question in questions.items()}
+        answers = {}
+        for key, future in futures.items():
+            try:
+                answers[key] = future.result()
+            except Exception as e:
+                logger.error(f"Error answering question {key}: {str(e)}")
+                answers[key] = {"question": questions[key], "error": str(e)}
+        return answers
+
+    def health(self) -> Dict[str, Any]:
+        return {"status": "ok", "retrieval_batches": self.retrieval.summary()}
+
+
+def make_handler(service: QueryService):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: Dict[str, Any]):
+            body = json.dumps(payload, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, service.health())
+            else:
+                self._send(404, {"error": f"Unknown endpoint {self.path}"})
+
+        def do_POST(self):
+            try:
+                payload = self._read_json()
+            except ValueError:
+                self._send(400, {"error": "Request body must be JSON"})
+                return
+            try:
+                if self.path == "/question":
+                    question = payload.get("question")
+                    if not isinstance(question, str) or not question.strip():
+                        self._send(400, {"error": "Missing 'question'"})
+                        return
+                    self._send(200, service.answer(question))
+                elif self.path == "/batch":
+                    questions = payload.get("questions")
+                    if isinstance(questions, list):
+                        questions = {str(i): question for i, question in enumerate(questions)}
+                    if not isinstance(questions, dict) or not questions:
+                        self._send(400, {"error": "Missing 'questions' (a list or an object of key to question)"})
+                        return
+                    self._send(200, {"answers": service.answer_many(questions)})
+                else:
+                    self._send(404, {"error": f"Unknown endpoint {self.path}"})
+            except Exception as e:
+                logger.error(f"Error handling {self.path}: {str(e)}")
+                self._send(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} - {format % args}")
+
+    return QueryHandler
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 resets connections under concurrent load
+    request_queue_size = 128
+
+
+def serve(service: QueryService, host: str = SERVICE_HOST, port: int = SERVICE_PORT) -> QueryServer:
+    return QueryServer((host, port), make_handler(service))
+
+
+def load_test(concurrency_levels=(1, 4, 16, 64), requests_per_level: int = 256):
+    """Measure throughput against a stub engine with fixed per-call model latencies"""
+    import urllib.request
+
+    class StubDocument:
+        def __init__(self, source):
+            self.metadata = {"source": source, "page": 0}
+
+    class StubEngine:
+        """One embedding call plus index search costs 30ms regardless of batch size, generation 50ms"""
+
+        def cached_answer(self, question):
+            return None
+
+        def retrieve_many(self, questions):
+            time.sleep(0.03)
+            return [[StubDocument("stub.pdf")] for _ in questions]
+
+        def answer_with_documents(self, question, documents, tier=None):
+            time.sleep(0.05)
+            return {"result": f"Answer to {question}", "source_documents": documents, "tier": "short"}
+
+    service = QueryService(StubEngine())
+    server = serve(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/question"
+
+    def ask(i):
+        request = urllib.request.Request(url, data=json.dumps({"question": f"Question {i}?"}).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    for concurrency in concurrency_levels:
+        before = service.retrieval.summary()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(ask, range(requests_per_level)))
+        elapsed = time.perf_counter() - started
+        after = service.retrieval.summary()
+        batches = after["batches"] - before["batches"]
+        print(f"concurrency {concurrency:3d}: {requests_per_level / elapsed:7.1f} questions/s, "
+              f"{requests_per_level / batches:5.1f} questions per retrieval batch")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP service answering questions over the security documents")
+    parser.add_argument("--docs", help="documents folder (defaults to the one vision.py answers against)")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--loadtest", action="store_true", help="measure throughput against a stub model and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.loadtest:
+        load_test()
+        return
+
+    from security_rag import SecurityRAG
+
+    engine = SecurityRAG(args.docs) if args.docs else SecurityRAG()
+    engine.refresh()
+    server = serve(QueryService(engine), args.host, args.port)
+    logger.info(f"Serving /question, /batch and /health on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
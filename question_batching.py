@@ -0,0 +1,166 @@
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from context_compression import estimate_tokens, trim_overlaps
+
+logger = logging.getLogger(__name__)
+
+CLOSED_QUESTION_PATTERN = re.compile(
+    r"^\s*(do|does|did|is|are|was|were|would|will|has|have|can|could|please mark)\b",
+    re.IGNORECASE
+)
+
+BATCH_SYSTEM_PROMPT = """You are a cybersecurity compliance auditor answering a vendor security questionnaire.
+Answer every question using only the provided documentation context.
+Start each answer with Yes, No or Unable to determine, followed by one or two sentences of supporting evidence.
+If the context does not cover a question, say that the documentation does not provide this information.
+Respond with a JSON object of the form {"answers": [{"key": "<question key>", "answer": "<answer>"}]} containing one entry per question."""
+
+
+def is_closed_question(question: str) -> bool:
+    """True for yes/no style questions that can share a batched answer call"""
+    return bool(CLOSED_QUESTION_PATTERN.match(question))
+
+
+def group_questions(questions: Dict[str, str], max_group_size: int) -> List[Dict[str, str]]:
+    """Group consecutive closed questions of a section, other questions stay on their own.
+
+    Questionnaire sections list related yes/no questions next to each other, so
+    consecutive runs are used as the grouping unit.
+    """
+    groups: List[Dict[str, str]] = []
+    current: Dict[str, str] = {}
+
+    for key, question in questions.items():
+        if is_closed_question(question):
+            current[key] = question
+            if len(current) >= max_group_size:
+                groups.append(current)
+                current = {}
+            continue
+        if current:
+            groups.append(current)
+            current = {}
+        groups.append({key: question})
+
+    if current:
+        groups.append(current)
+    return groups
+
+
+def document_key(doc: Document) -> Tuple[Any, Any, Any, Any]:
+    # Compressed chunks of the same page can start at the same offset with different sentences
+    content = doc.page_content if doc.metadata.get("compressed") else None
+    return (doc.metadata.get("source"), doc.metadata.get("page"), doc.metadata.get("start_index"), content)
+
+
+class BatchAnswerer:
+    """Answers a group of related questions with one shared context and one LLM call"""
+
+    def __init__(self, retriever, llm, max_context_tokens: int = 3000, max_tokens_per_question: Optional[int] = None):
+        self.retriever = retriever
+        self.llm = llm.bind(response_format={"type": "json_object"})
+        self.max_context_tokens = max_context_tokens
+        self.max_tokens_per_question = max_tokens_per_question
+
+    def retrieve(self, group: Dict[str, str]) -> Tuple[List[Document], Dict[str, List[Document]]]:
+        """Retrieve per question and merge into one deduplicated context
+
+        Chunks that do not fit the token budget are skipped, so smaller
+        lower-ranked chunks can still be used. Each question's documents are
+        only those of its retrieved chunks that made it into the context.
+        """
+        per_question: Dict[str, List[Document]] = {}
+        merged: List[Document] = []
+        seen = set()
+
+        for key, question in group.items():
+            docs = self.retriever.invoke(question)
+            per_question[key] = docs
+            for doc in docs:
+                if document_key(doc) not in seen:
+                    seen.add(document_key(doc))
+                    merged.append(doc)
+
+        context = []
+        used = set()
+        budget = self.max_context_tokens
+        for origin, doc in trim_overlaps(merged):
+            tokens = estimate_tokens(doc.page_content)
+            if tokens > budget:
+                continue
+            budget -= tokens
+            context.append(doc)
+            used.add(document_key(merged[origin]))
+        if len(used) < len(merged):
+            logger.info(f"Batched context uses {len(used)} of {len(merged)} retrieved chunks")
+
+        per_question = {
+            key: [doc for doc in docs if document_key(doc) in used]
+            for key, docs in per_question.items()
+        }
+        return context, per_question
+
+    def build_messages(self, group: Dict[str, str], context: List[Document]):
+        context_text = "\n\n".join(
+            f"[{i + 1}] {doc.page_content}" for i, doc in enumerate(context)
+        ) or "No documentation context was retrieved."
+        questions_text = "\n".join(f"- {key}: {question}" for key, question in group.items())
+        return [
+            SystemMessage(content=BATCH_SYSTEM_PROMPT),
+            HumanMessage(content=f"Context:\n---------------------\n{context_text}\n---------------------\n\nQuestions:\n{questions_text}")
+        ]
+
+    def parse_answers(self, content: str, group: Dict[str, str]) -> Dict[str, str]:
+        """Map the structured response back to question keys, ignoring unknown keys"""
+        try:
+            payload = json.loads(content)
+        except json.JSONDecodeError as e:
+            logger.error(f"Could not parse batched answer: {str(e)}")
+            return {}
+
+        entries = payload.get("answers", []) if isinstance(payload, dict) else payload
+        if isinstance(entries, dict):
+            entries = [{"key": k, "answer": v} for k, v in entries.items()]
+
+        answers = {}
+        for entry in entries or []:
+            if not isinstance(entry, dict):
+                continue
+            key, answer = entry.get("key"), entry.get("answer")
+            if key in group and isinstance(answer, str) and answer.strip():
+                answers[key] = answer.strip()
+        return answers
+
+    def answer_group(self, group: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Answer a group in a single call.
+
+        Returns answers in the RetrievalQA output shape for every question the
+        model answered; questions missing from the response are left out so the
+        caller can fall back to answering them individually.
+        """
+        context, per_question = self.retrieve(group)
+        llm = self.llm
+        if self.max_tokens_per_question:
+            llm = llm.bind(max_tokens=self.max_tokens_per_question * len(group))
+        response = llm.invoke(self.build_messages(group, context))
+        parsed = self.parse_answers(response.content, group)
+
+        missing = set(group) - set(parsed)
+        if missing:
+            logger.warning(f"Batched answer missing {len(missing)} of {len(group)} questions: {sorted(missing)}")
+
+        return {
+            key: {
+                "query": group[key],
+                "result": answer,
+                "source_documents": per_question.get(key, []),
+                "batched": True
+            }
+            for key, answer in parsed.items()
+        }
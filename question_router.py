@@ -0,0 +1,62 @@
+import hashlib
+import logging
+import re
+import threading
+from typing import Dict
+
+from question_batching import is_closed_question
+
+logger = logging.getLogger(__name__)
+
+SHORT = "short"
+NARRATIVE = "narrative"
+
+NARRATIVE_LEAD_PATTERN = re.compile(r"^\s*(describe|detail|explain|identify)\b", re.IGNORECASE)
+SHORT_FACT_PATTERN = re.compile(
+    r"^\s*(how many|how long|how often|where|who|which|at which|classify|what is your \w+ frequency)\b",
+    re.IGNORECASE
+)
+
+_tier_cache: Dict[str, Dict[str, Dict[str, str]]] = {}
+_tier_cache_lock = threading.Lock()
+
+
+def classify_question(question: str) -> str:
+    """Classify a question as short-form (yes/no, short fact) or narrative"""
+    if is_closed_question(question):
+        return SHORT
+    if NARRATIVE_LEAD_PATTERN.match(question):
+        return NARRATIVE
+    if SHORT_FACT_PATTERN.match(question):
+        return SHORT
+    return NARRATIVE
+
+
+def questionnaire_fingerprint(questions: Dict[str, Dict[str, str]]) -> str:
+    digest = hashlib.sha1()
+    for section, section_questions in sorted(questions.items()):
+        for key, question in sorted(section_questions.items()):
+            digest.update(f"{section}\0{key}\0{question}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def classify_questionnaire(questionnaire) -> Dict[str, Dict[str, str]]:
+    """Classify every question once per questionnaire; results are cached by content"""
+    fingerprint = questionnaire_fingerprint(questionnaire.questions)
+    with _tier_cache_lock:
+        cached = _tier_cache.get(fingerprint)
+        if cached is not None:
+            return cached
+
+        tiers = {
+            section: {key: classify_question(question) for key, question in questions.items()}
+            for section, questions in questionnaire.questions.items()
+        }
+        _tier_cache[fingerprint] = tiers
+
+    counts = {}
+    for section_tiers in tiers.values():
+        for tier in section_tiers.values():
+            counts[tier] = counts.get(tier, 0) + 1
+    logger.info(f"Classified questionnaire questions by tier: {counts}")
+    return tiers
@@ -0,0 +1,321 @@
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from generation_client import DeadlineExceeded, current_attempt
+from model_scheduler import ModelCallScheduler
+
+logger = logging.getLogger(__name__)
+
+# Provider limits shared by every embedding and chat call in the process
+REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+# Calls slower than this (to the first chunk, for streams) shrink the concurrency limit
+LATENCY_TARGET_SECONDS = float(os.getenv("OPENAI_LATENCY_TARGET", "30"))
+# Timeouts, connection errors and 5xx responses are retried this often, like the OpenAI SDK does by default
+TRANSIENT_RETRIES = 2
+
+# Exception classes (or their bases) of openai and httpx that mean the request never got an answer
+TRANSIENT_ERROR_TYPES = {"APIConnectionError", "TransportError"}
+
+_END_OF_STREAM = object()
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for provider throttling errors (HTTP 429)"""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message
+
+
+def is_transient_error(error: Exception) -> bool:
+    """True for failures worth retrying unchanged: timeouts, connection errors and 5xx responses"""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status in (408, 409)
+    # Matched by name so neither openai nor httpx has to be imported here
+    return any(cls.__name__ in TRANSIENT_ERROR_TYPES for cls in type(error).__mro__)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` units per minute.
+
+    Bursts are capped at `burst_seconds` worth of refill, since providers
+    enforce per-minute limits over shorter windows.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep, burst_seconds: float = 1.0):
+        self.max_rate = per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = max(1.0, self.max_rate * burst_seconds)
+        self.available = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def decrease_rate(self, factor: float = 0.75):
+        """Slow the refill rate multiplicatively, down to 10% of the configured rate"""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.max_rate * 0.1, self.rate * factor)
+
+    def increase_rate(self, fraction: float = 0.02):
+        """Recover the refill rate additively towards the configured rate"""
+        with self._lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate * fraction)
+
+    def acquire(self, amount: float = 1.0):
+        """Block until `amount` units are available; requests above capacity take the full bucket"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            self.sleep(min(wait, 1.0))
+
+
+class AdaptiveRateLimiter:
+    """Process-wide limiter for model calls.
+
+    Requests take a slot from a priority scheduler (interactive before batch
+    work) and pass a requests-per-minute and a tokens-per-minute bucket. The
+    scheduler's capacity is an adaptive concurrency limit that grows
+    additively after successful calls and is halved on throttling (AIMD);
+    calls slower than the latency target shrink it gently. Throttling also
+    slows the request bucket, which recovers towards the configured rate as
+    calls succeed. Throttled calls are retried with jittered exponential
+    backoff, honouring Retry-After when the provider sends one. Timeouts,
+    connection errors and 5xx responses are retried the same way on the
+    first `transient_retries` attempts, without touching the limits, since
+    the clients themselves are built with max_retries=0. Calls made for a
+    GenerationClient attempt that was abandoned or ran past its deadline are
+    not started or retried.
+    """
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE, tokens_per_minute: float = TOKENS_PER_MINUTE,
+                 max_concurrency: int = MAX_CONCURRENCY, min_concurrency: int = 1, max_retries: int = 6,
+                 base_backoff: float = 1.0, max_backoff: float = 60.0,
+                 latency_target: Optional[float] = LATENCY_TARGET_SECONDS, transient_retries: int = TRANSIENT_RETRIES,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.requests = TokenBucket(requests_per_minute, clock, sleep)
+        self.tokens = TokenBucket(tokens_per_minute, clock, sleep)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.latency_target = latency_target
+        self.transient_retries = transient_retries
+        self.clock = clock
+        self.sleep = sleep
+
+        self.limit = float(max(min_concurrency, max_concurrency // 2))
+        self.last_decrease = clock()
+        self.scheduler = ModelCallScheduler(int(self.limit), name="openai")
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "throttled": 0, "retries": 0, "transient_retries": 0, "failures": 0,
+                      "abandoned": 0, "tokens": 0}
+
+    def _on_success(self, latency: float):
+        with self._lock:
+            if self.latency_target and latency > self.latency_target:
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+            self.scheduler.set_capacity(int(self.limit))
+        self.requests.increase_rate()
+
+    def _on_throttle(self, started: float):
+        with self._lock:
+            self.stats["throttled"] += 1
+            # Calls issued before the last decrease were sent under the old limit
+            if started < self.last_decrease:
+                return
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self.last_decrease = self.clock()
+            self.scheduler.set_capacity(int(self.limit))
+        self.requests.decrease_rate()
+
+    def backoff(self, attempt: int, error: Optional[Exception] = None) -> float:
+        retry_after = retry_after_seconds(error) if error is not None else None
+        ceiling = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        delay = random.uniform(0, ceiling)  # full jitter
+        return max(delay, retry_after or 0.0)
+
+    def _check_attempt(self, delay: float = 0.0):
+        """Raise DeadlineExceeded instead of (re)trying for a request that no longer waits for the answer"""
+        attempt = current_attempt()
+        if attempt is not None and (attempt.expired() or attempt.remaining() < delay):
+            with self._lock:
+                self.stats["abandoned"] += 1
+            raise DeadlineExceeded("Model call dropped: its request was abandoned or is past its deadline")
+
+    def _retry_or_raise(self, error: Exception, attempt: int, started: float):
+        """Back off before the next attempt if the error was throttling or transient, otherwise re-raise it"""
+        if is_rate_limit_error(error) and attempt < self.max_retries:
+            self._on_throttle(started)
+            delay = self.backoff(attempt, error)
+            with self._lock:
+                self.stats["retries"] += 1
+            self._check_attempt(delay)
+            logger.warning(f"Rate limited, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+            self.sleep(delay)
+            return
+        if is_transient_error(error) and attempt < min(self.transient_retries, self.max_retries):
+            delay = self.backoff(attempt, error)
+            self._check_attempt(delay)
+            with self._lock:
+                self.stats["transient_retries"] += 1
+            logger.warning(f"Model call failed ({type(error).__name__}: {str(error)}), retrying in {delay:.1f}s")
+            self.sleep(delay)
+            return
+        with self._lock:
+            self.stats["failures"] += 1
+        raise error
+
+    def _on_call(self, estimated_tokens: int):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["tokens"] += estimated_tokens
+
+    def run(self, fn: Callable[..., Any], *args, estimated_tokens: int = 0, **kwargs) -> Any:
+        """Run a model call under the shared limits, retrying throttled attempts"""
+        for attempt in range(self.max_retries + 1):
+            self._check_attempt()
+            # The slot is taken first so the buckets are consumed in priority order
+            with self.scheduler.slot():
+                self.requests.acquire(1)
+                if estimated_tokens:
+                    self.tokens.acquire(estimated_tokens)
+                started = self.clock()
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+
+            if error is None:
+                self._on_success(self.clock() - started)
+                self._on_call(estimated_tokens)
+                return result
+            self._retry_or_raise(error, attempt, started)
+
+    def stream(self, fn: Callable[..., Iterator], *args, estimated_tokens: int = 0, **kwargs) -> Iterator:
+        """Like run, for calls that return a stream; the slot is held until the stream is exhausted.
+
+        Throttling is only retried before the first chunk, since chunks already
+        handed to the caller cannot be taken back.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._check_attempt()
+            with self.scheduler.slot():
+                self.requests.acquire(1)
+                if estimated_tokens:
+                    self.tokens.acquire(estimated_tokens)
+                started = self.clock()
+                try:
+                    iterator = iter(fn(*args, **kwargs))
+                    first = next(iterator, _END_OF_STREAM)
+                except Exception as e:
+                    error = e
+                else:
+                    # Latency to the first chunk is what the concurrency limit adapts to
+                    self._on_success(self.clock() - started)
+                    self._on_call(estimated_tokens)
+                    if first is not _END_OF_STREAM:
+                        yield first
+                    yield from iterator
+                    return
+            self._retry_or_raise(error, attempt, started)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                self.stats,
+                concurrency_limit=round(self.limit, 2),
+                requests_per_minute=round(self.requests.rate * 60),
+                scheduler=self.scheduler.summary()
+            )
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """The limiter shared by every model call in this process"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = AdaptiveRateLimiter()
+        return _rate_limiter
+
+
+if __name__ == "__main__":
+    # Local stub provider that answers 429 above its own concurrency and rate ceiling
+    from concurrent.futures import ThreadPoolExecutor
+
+    logging.basicConfig(level=logging.ERROR)
+
+    class StubRateLimitError(Exception):
+        status_code = 429
+
+    class StubProvider:
+        def __init__(self, max_concurrent=6, per_second=40):
+            self.lock = threading.Lock()
+            self.active = 0
+            self.max_concurrent = max_concurrent
+            self.window = []
+            self.per_second = per_second
+            self.rejected = 0
+
+        def complete(self, _):
+            with self.lock:
+                now = time.monotonic()
+                self.window = [t for t in self.window if now - t < 1.0]
+                if self.active >= self.max_concurrent or len(self.window) >= self.per_second:
+                    self.rejected += 1
+                    raise StubRateLimitError("429 Too Many Requests")
+                self.active += 1
+                self.window.append(now)
+            time.sleep(0.05)
+            with self.lock:
+                self.active -= 1
+            return "ok"
+
+    provider = StubProvider()
+    # Configured slightly above the stub's real ceiling, so the limiter has to adapt
+    limiter = AdaptiveRateLimiter(requests_per_minute=3000, tokens_per_minute=10 ** 7, max_concurrency=16,
+                                  max_retries=10, base_backoff=0.05, max_backoff=1.0)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        list(executor.map(lambda i: limiter.run(provider.complete, i, estimated_tokens=100), range(400)))
+    elapsed = time.monotonic() - started
+    print(f"400 calls in {elapsed:.1f}s ({400 / elapsed:.1f}/s, provider ceiling 40/s), "
+          f"429s injected: {provider.rejected}, limiter: {limiter.summary()}")
@@ -0,0 +1,249 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.getenv("RAG_RESULTS_DIR", "results")
+
+# Schema of one answered question. Runs are written as JSONL (one record per
+# line, appended as answers complete) and mirrored into the SQLite `answers`
+# table; list and dict fields are stored as JSON text in SQLite.
+RESULT_FIELDS = [
+    ("run_id", "TEXT"),
+    ("section", "TEXT"),
+    ("section_name", "TEXT"),
+    ("question_key", "TEXT"),
+    ("question", "TEXT"),
+    ("answer", "TEXT"),             # None when the question failed
+    ("error", "TEXT"),              # None unless the question failed
+    ("tier", "TEXT"),               # routing tier: short or narrative
+    ("batched", "INTEGER"),         # answered together with other closed questions
+    ("cache_hit", "TEXT"),          # approved answer provenance, or None
+    ("sources", "TEXT"),            # [{"source": file name, "page": 1-based page number or None}]
+    ("elapsed_seconds", "REAL"),
+    ("prompt_tokens", "INTEGER"),
+    ("completion_tokens", "INTEGER"),
+    ("completed_at", "TEXT"),       # ISO 8601, UTC
+]
+JSON_FIELDS = ("cache_hit", "sources")
+
+_SOURCE_PAGE = re.compile(r"^(.*) \((?:Page|p\.) (\d+)\)$")
+
+
+def answer_sources(answer: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Source file and 1-based page of every chunk an answer was based on, without duplicates"""
+    if answer.get("sources") is not None:
+        return answer["sources"]
+    sources = []
+    for doc in answer.get("source_documents", []):
+        page = doc.metadata.get("page")
+        source = {
+            "source": os.path.basename(str(doc.metadata.get("source", "[Document reference]"))),
+            "page": page + 1 if isinstance(page, int) else None,
+        }
+        if source not in sources:
+            sources.append(source)
+    return sources
+
+
+def approved_sources(sources: Optional[str]) -> List[Dict[str, Any]]:
+    """Sources of an approved answer, parsed back from the text ui.py saved with it
+
+    That text lists sources as "file (Page 3), file (p. 4), file"; see
+    load_qa_sections and regenerate_answer.
+    """
+    parsed = []
+    for part in (sources or "").split(", "):
+        part = part.strip()
+        if not part:
+            continue
+        match = _SOURCE_PAGE.match(part)
+        source = {"source": match.group(1), "page": int(match.group(2))} if match else {"source": part, "page": None}
+        if source not in parsed:
+            parsed.append(source)
+    return parsed
+
+
+def result_record(run_id: str, section: str, section_name: str, question_key: str, question: str,
+                  answer: Dict[str, Any], elapsed: float = 0.0) -> Dict[str, Any]:
+    """Result record for an answer produced by the answering pipeline"""
+    usage = answer.get("usage") or {}
+    sources = answer_sources(answer)
+    cache_hit = answer.get("cache_hit")
+    if cache_hit:
+        # A reused approved answer is based on the sources it was approved with
+        sources = sources or approved_sources(cache_hit.get("sources"))
+        cache_hit = {key: value for key, value in cache_hit.items() if key != "sources"}
+    return {
+        "run_id": run_id,
+        "section": section,
+        "section_name": section_name,
+        "question_key": question_key,
+        "question": question,
+        "answer": answer.get("result"),
+        "error": answer.get("error"),
+        "tier": answer.get("tier"),
+        "batched": bool(answer.get("batched")),
+        "cache_hit": cache_hit,
+        "sources": sources,
+        "elapsed_seconds": round(elapsed, 3),
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "completed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+class ResultsStore:
+    """System of record for questionnaire runs: JSONL files plus a SQLite table with the same schema"""
+
+    def __init__(self, directory: str = RESULTS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, "results.db"), check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.create_tables()
+
+    def create_tables(self):
+        columns = ",\n".join(f"{name} {kind}" for name, kind in RESULT_FIELDS)
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS answers (
+                    {columns},
+                    PRIMARY KEY (run_id, section, question_key)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    sections TEXT,
+                    report TEXT,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+            self.conn.commit()
+
+    def jsonl_path(self, run_id: str) -> str:
+        return os.path.join(self.directory, f"{run_id}.jsonl")
+
+    def start_run(self, run_id: str, sections: Dict[str, str]):
+        with self._lock:
+            self.conn.execute('''
+                INSERT OR IGNORE INTO runs (run_id, sections) VALUES (?, ?)
+            ''', (run_id, json.dumps(sections)))
+            self.conn.commit()
+
+    def append(self, record: Dict[str, Any]):
+        """Add one answered question to its run; a later record for the same question replaces it"""
+        row = [
+            json.dumps(record.get(name)) if name in JSON_FIELDS else record.get(name)
+            for name, _ in RESULT_FIELDS
+        ]
+        placeholders = ", ".join("?" for _ in RESULT_FIELDS)
+        with self._lock:
+            with open(self.jsonl_path(record["run_id"]), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+            self.conn.execute(f"INSERT OR REPLACE INTO answers VALUES ({placeholders})", row)
+            self.conn.commit()
+
+    def finish_run(self, run_id: str, report: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self.conn.execute('''
+                UPDATE runs SET report = ?, finished_at = CURRENT_TIMESTAMP WHERE run_id = ?
+            ''', (json.dumps(report, default=str), run_id))
+            self.conn.commit()
+
+    def list_runs(self) -> List[Dict[str, Any]]:
+        """Runs, newest first, with how many questions each answered"""
+        with self._lock:
+            rows = self.conn.execute('''
+                SELECT r.run_id, r.started_at, r.finished_at, COUNT(a.question_key) AS answers
+                FROM runs r LEFT JOIN answers a ON a.run_id = r.run_id
+                GROUP BY r.run_id
+                ORDER BY r.started_at DESC, r.rowid DESC
+            ''').fetchall()
+        return [dict(row) for row in rows]
+
+    def latest_run_id(self, finished_only: bool = False) -> Optional[str]:
+        for run in self.list_runs():
+            if run["answers"] and (run["finished_at"] or not finished_only):
+                return run["run_id"]
+        return None
+
+    def load_run(self, run_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Records of a run (the latest one by default), in the order they were answered"""
+        run_id = run_id or self.latest_run_id()
+        if run_id is None:
+            return []
+        with self._lock:
+            rows = self.conn.execute('''
+                SELECT * FROM answers WHERE run_id = ? ORDER BY completed_at, rowid
+            ''', (run_id,)).fetchall()
+        return [self._record(row) for row in rows]
+
+    def iter_run(self, run_id: str, questions: Optional[Dict[str, Dict[str, str]]] = None) -> Iterator[Dict[str, Any]]:
+        """Records of a run in the order order_records gives them, loading one section at a time"""
+        with self._lock:
+            answered = [row["section"] for row in self.conn.execute('''
+                SELECT section FROM answers WHERE run_id = ?
+                GROUP BY section ORDER BY MIN(completed_at), MIN(rowid)
+            ''', (run_id,)).fetchall()]
+        sections = [section for section in questions or {} if section in answered]
+        sections += [section for section in answered if section not in sections]
+        for section in sections:
+            with self._lock:
+                rows = self.conn.execute('''
+                    SELECT * FROM answers WHERE run_id = ? AND section = ? ORDER BY completed_at, rowid
+                ''', (run_id, section)).fetchall()
+            records = [self._record(row) for row in rows]
+            yield from order_records(records, questions).get(section, [])
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        for name in JSON_FIELDS:
+            record[name] = json.loads(record[name]) if record[name] else None
+        record["batched"] = bool(record["batched"])
+        return record
+
+    def run_version(self, run_id: str) -> str:
+        """Changes whenever a record of the run is added or replaced, or the run finishes"""
+        with self._lock:
+            row = self.conn.execute('''
+                SELECT COUNT(a.run_id) AS answers, MAX(a.rowid) AS last_row, MAX(a.completed_at) AS last_answer,
+                       r.finished_at
+                FROM runs r LEFT JOIN answers a ON a.run_id = r.run_id
+                WHERE r.run_id = ?
+            ''', (run_id,)).fetchone()
+        key = f"{row['answers']}:{row['last_row']}:{row['last_answer']}:{row['finished_at']}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+    def run_report(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute('SELECT report FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        return json.loads(row["report"]) if row and row["report"] else None
+
+
+def order_records(records: List[Dict[str, Any]], questions: Optional[Dict[str, Dict[str, str]]] = None):
+    """Group records as {section: [record, ...]}, in questionnaire order when questions are given"""
+    by_section: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        by_section.setdefault(record["section"], []).append(record)
+    if not questions:
+        return by_section
+    ordered = {}
+    for section, section_questions in questions.items():
+        position = {key: i for i, key in enumerate(section_questions)}
+        if section in by_section:
+            ordered[section] = sorted(by_section.pop(section), key=lambda r: position.get(r["question_key"], len(position)))
+    ordered.update(by_section)
+    return ordered
@@ -0,0 +1,90 @@
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class RunReport:
+    """Collects timings and counters for a single questionnaire run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.finished = None
+        self.question_latencies: List[float] = []
+        self.errors = 0
+        self.counters: Dict[str, int] = {}
+        self.tiers: Dict[str, Dict[str, Any]] = {}
+        self.sections: Dict[str, Dict[str, Any]] = {}
+
+    def record_question(self, seconds: float, error: bool = False):
+        with self._lock:
+            self.question_latencies.append(seconds)
+            if error:
+                self.errors += 1
+
+    def record_tier(self, tier: str, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0, questions: int = 1):
+        """Record latency and token usage of one model call for a routing tier"""
+        with self._lock:
+            stats = self.tiers.setdefault(tier, {
+                "questions": 0, "latencies": [], "prompt_tokens": 0, "completion_tokens": 0
+            })
+            stats["questions"] += questions
+            stats["latencies"].append(seconds)
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_section(self, name: str, data: Dict[str, Any]):
+        """Attach the summary of a pipeline stage (compression, caching, ...)"""
+        with self._lock:
+            self.sections[name] = data
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = list(self.question_latencies)
+            end = self.finished or time.perf_counter()
+            report = {
+                "total_seconds": round(end - self.started, 2),
+                "questions": len(latencies),
+                "errors": self.errors,
+                "latency_p50": round(percentile(latencies, 50), 2),
+                "latency_p95": round(percentile(latencies, 95), 2),
+            }
+            report.update(self.counters)
+            if self.tiers:
+                report["tiers"] = {
+                    tier: {
+                        "questions": stats["questions"],
+                        "calls": len(stats["latencies"]),
+                        "latency_p50": round(percentile(stats["latencies"], 50), 2),
+                        "latency_p95": round(percentile(stats["latencies"], 95), 2),
+                        "prompt_tokens": stats["prompt_tokens"],
+                        "completion_tokens": stats["completion_tokens"],
+                    }
+                    for tier, stats in self.tiers.items()
+                }
+            report.update({name: dict(data) for name, data in self.sections.items()})
+            return report
+
+    def log_summary(self):
+        for key, value in self.as_dict().items():
+            logger.info(f"Run report - {key}: {value}")
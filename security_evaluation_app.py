@@ -4,6 +4,7 @@ import pandas as pd
 import re
 import json
 import os
+from results_store import ResultsStore
 
 class SecurityEvaluationApp:
     def __init__(self):
@@ -22,8 +23,24 @@ class SecurityEvaluationApp:
         if 'evaluation_criteria' not in st.session_state:
             self.load_evaluation_criteria()
 
+    def load_qa_pairs(self, run_id):
+        """Load Q&A pairs of a run from the results store"""
+        qa_pairs = []
+        for record in ResultsStore().load_run(run_id):
+            if record['error'] is not None:
+                continue
+            qa_pairs.append({
+                'question': record['question'],
+                'answer': record['answer'],
+                'sources': [
+                    f"{source['source']} (Page {source['page']})" if source['page'] else source['source']
+                    for source in record['sources'] or []
+                ]
+            })
+        return qa_pairs
+
     def parse_qa_pairs(self, content):
-        """Parse Q&A pairs from the text content"""
+        """Parse Q&A pairs from a text report written before runs were kept in the results store"""
         sections = content.split("________________________________________________________________________________")
         qa_pairs = []
         
@@ -58,13 +75,21 @@ class SecurityEvaluationApp:
                 os.remove('./.streamlit/evaluations.json')
             st.success("All data cleared!")
         
-        # File uploader
-        uploaded_file = st.file_uploader("Upload security questionnaire responses", type=['txt'])
-        if uploaded_file:
-            content = uploaded_file.getvalue().decode("utf-8")
-            qa_pairs = self.parse_qa_pairs(content)
+        # Runs from the results store, or a legacy text report
+        runs = ResultsStore().list_runs()
+        run_labels = {f"{run['run_id']} ({run['answers']} answers, {run['started_at']})": run['run_id'] for run in runs}
+        selected = st.selectbox("Run to evaluate", list(run_labels) + ["Upload a text report"])
+        if selected in run_labels:
+            qa_pairs = self.load_qa_pairs(run_labels[selected])
             st.session_state.current_responses = qa_pairs
             self.display_evaluations(qa_pairs)
+        else:
+            uploaded_file = st.file_uploader("Upload security questionnaire responses", type=['txt'])
+            if uploaded_file:
+                content = uploaded_file.getvalue().decode("utf-8")
+                qa_pairs = self.parse_qa_pairs(content)
+                st.session_state.current_responses = qa_pairs
+                self.display_evaluations(qa_pairs)
 
         # Export button
         if st.session_state.evaluations:
@@ -1,42 +1,315 @@
+import hashlib
+import json
 import logging
+import os
 import sys
-from PyPDF2 import SimpleDirectoryReader
-import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Union
+
+from langchain_community.vectorstores import FAISS
+
+from question_router import classify_question
+from run_report import RunReport
+from single_flight import normalize_question
+from upload_store import read_manifest
+from vision import (
+    CONCURRENT_LIMIT,
+    DOCS_PATH,
+    AnswerPipeline,
+    build_vector_store,
+    create_pipeline,
+    compute_index_version,
+    embeddings,
+    load_documents,
+    time_to_first_token,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = "faiss_index"
+SUPPORTED_EXTENSIONS = ('.pdf',)
+# Answers kept for repeated questions; the least recently used are dropped first
+MAX_CACHED_ANSWERS = 2000
+
+
+def documents_fingerprint(docs_path: str) -> str:
+    """Content hash of the supported documents in a folder
+
+    Files listed in the folder's upload manifest are identified by the hash
+    recorded there instead of being read again.
+    """
+    hashes = read_manifest(docs_path)
+    digest = hashlib.sha1()
+    for filename in sorted(os.listdir(docs_path)):
+        if os.path.splitext(filename)[1].lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        digest.update(filename.encode('utf-8'))
+        if filename in hashes:
+            digest.update(hashes[filename].encode('utf-8'))
+            continue
+        with open(os.path.join(docs_path, filename), 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def documents_stat(docs_path: str) -> tuple:
+    """Name, size and modification time of the supported documents; cheap to compare before hashing"""
+    entries = []
+    for filename in sorted(os.listdir(docs_path)):
+        if os.path.splitext(filename)[1].lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        stat = os.stat(os.path.join(docs_path, filename))
+        entries.append((filename, stat.st_size, stat.st_mtime_ns))
+    return tuple(entries)
+
+
+class SecurityRAG:
+    """Long-lived answering engine over one documents folder.
+
+    The vector index is persisted next to a manifest of the documents it was
+    built from, so restarts reuse it and only changed documents trigger a
+    rebuild. Answers are cached per index version (the MAX_CACHED_ANSWERS most
+    recently used), so repeated questions cost nothing, and reviewer-approved
+    answers are served from the pipeline's answer cache. Safe to share between threads: refresh swaps in a new pipeline
+    while queries keep using the one they started with.
+    """
+
+    def __init__(self, docs_path: str = DOCS_PATH, index_dir: str = INDEX_DIR, job_id: str = "security-rag"):
+        self.docs_path = docs_path
+        self.index_dir = index_dir
+        self.job_id = job_id
+        self.report = RunReport()
+        self.pipeline: Optional[AnswerPipeline] = None
+        self.fingerprint = None
+        self._documents_stat = None
+        self._answers: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=CONCURRENT_LIMIT, thread_name_prefix="security-rag")
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.index_dir, "manifest.json")
+
+    def _load_persisted(self, fingerprint: str):
+        """The persisted vector store and its index version, if built from the same documents"""
+        try:
+            with open(self._manifest_path(), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if manifest.get("fingerprint") != fingerprint:
+            return None, None
+        try:
+            vector_store = FAISS.load_local(self.index_dir, embeddings, allow_dangerous_deserialization=True)
+        except Exception as e:
+            logger.error(f"Could not load the persisted index, rebuilding it: {str(e)}")
+            return None, None
+        return vector_store, manifest.get("index_version")
+
+    def _build(self, fingerprint: str, progress=None):
+        texts = load_documents(self.docs_path, progress)
+        vector_store = build_vector_store(texts, self.job_id, progress)
+        index_version = compute_index_version(texts)
+        os.makedirs(self.index_dir, exist_ok=True)
+        vector_store.save_local(self.index_dir)
+        with open(self._manifest_path(), 'w', encoding='utf-8') as f:
+            json.dump({"fingerprint": fingerprint, "index_version": index_version, "chunks": len(texts)}, f)
+        logger.info(f"Indexed {len(texts)} chunks from {self.docs_path}")
+        return vector_store, index_version
+
+    def refresh(self, progress=None) -> bool:
+        """Reload the index if the documents changed; returns True if a new index was loaded
+        
+        progress is passed on to load_documents and build_vector_store when the index is rebuilt.
+        """
+        with self._refresh_lock:
+            # Documents are only hashed again when a file was added, removed or touched
+            stat = documents_stat(self.docs_path)
+            if stat == self._documents_stat and self.pipeline is not None:
+                return False
+            fingerprint = documents_fingerprint(self.docs_path)
+            if fingerprint == self.fingerprint and self.pipeline is not None:
+                self._documents_stat = stat
+                return False
+
+            vector_store, index_version = self._load_persisted(fingerprint)
+            if vector_store is None:
+                vector_store, index_version = self._build(fingerprint, progress)
+            else:
+                logger.info(f"Loaded persisted index {index_version} from {self.index_dir}")
+            pipeline = create_pipeline(vector_store, index_version, self.job_id)
+
+            with self._lock:
+                self.pipeline, self.fingerprint, self._documents_stat = pipeline, fingerprint, stat
+                # Answers against older documents are no longer valid
+                self._answers = OrderedDict(
+                    (key, answer) for key, answer in self._answers.items() if key[0] == index_version
+                )
+            return True
+
+    def _current_pipeline(self) -> AnswerPipeline:
+        with self._lock:
+            pipeline = self.pipeline
+        if pipeline is None:
+            self.refresh()
+            with self._lock:
+                pipeline = self.pipeline
+        return pipeline
+
+    def current_pipeline(self, progress=None, job_id: Optional[str] = None) -> AnswerPipeline:
+        """The pipeline over the documents as they are now, e.g. to pass to process_rag_queries
+
+        Approved answers added since the pipeline was built are loaded first.
+        With job_id, the pipeline's model calls are scheduled as that job, so
+        concurrent jobs share the batch capacity round-robin.
+        """
+        self.refresh(progress)
+        pipeline = self._current_pipeline()
+        if pipeline.answer_cache:
+            try:
+                pipeline.answer_cache.refresh()
+            except Exception as e:
+                logger.error(f"Could not reload approved answers: {str(e)}")
+        return pipeline.for_job(job_id) if job_id else pipeline
+
+    def _cached(self, pipeline: AnswerPipeline, question: str) -> Optional[Dict]:
+        key = (pipeline.index_version, normalize_question(question))
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is not None:
+                self._answers.move_to_end(key)
+            return answer
+
+    def _remember(self, pipeline: AnswerPipeline, question: str, answer: Dict):
+        if "error" in answer:
+            return
+        key = (pipeline.index_version, normalize_question(question))
+        with self._lock:
+            self._answers[key] = answer
+            self._answers.move_to_end(key)
+            while len(self._answers) > MAX_CACHED_ANSWERS:
+                self._answers.popitem(last=False)
+
+    def _approved(self, pipeline: AnswerPipeline, question: str) -> Optional[Dict]:
+        """A reviewer-approved answer to the question, if the answer cache has one
+
+        Not remembered with the other answers: a later rejection withdraws it.
+        """
+        if not pipeline.answer_cache:
+            return None
+        try:
+            answer = pipeline.answer_cache.lookup(question)
+        except Exception as e:
+            logger.error(f"Answer cache lookup failed: {str(e)}")
+            return None
+        if answer:
+            self.report.increment("cache_hits")
+        return answer
+
+    def cached_answer(self, question: str) -> Optional[Dict]:
+        """The answer to a question asked before against the current documents, if any"""
+        return self._cached(self._current_pipeline(), question)
+
+    def query(self, question: str, tier: Optional[str] = None) -> Dict:
+        """Answer one question, reusing an approved answer or the answer if it was asked before"""
+        pipeline = self._current_pipeline()
+        approved = self._approved(pipeline, question)
+        if approved:
+            return approved
+        cached = self._cached(pipeline, question)
+        if cached:
+            self.report.increment("engine_cache_hits")
+            return cached
+        answer = pipeline.answer_question(question, tier or classify_question(question), self.report)
+        self._remember(pipeline, question, answer)
+        return answer
+
+    def stream(self, question: str, tier: Optional[str] = None) -> Iterator[Union[str, Dict]]:
+        """Answer one question token by token; see AnswerPipeline.stream_answer"""
+        pipeline = self._current_pipeline()
+        for item in pipeline.stream_answer(question, tier):
+            if isinstance(item, dict):
+                self._remember(pipeline, question, item)
+            yield item
+
+    def retrieve_many(self, questions: List[str]) -> List[List]:
+        """Retrieve for several questions with one embedding call and one index search"""
+        return self._current_pipeline().retrieve_many(questions)
+
+    def answer_with_documents(self, question: str, documents: List, tier: Optional[str] = None) -> Dict:
+        """Answer a question from documents retrieved with retrieve_many"""
+        pipeline = self._current_pipeline()
+        cached = self._cached(pipeline, question)
+        if cached:
+            self.report.increment("engine_cache_hits")
+            return cached
+        answer = pipeline.answer_from_documents(question, documents, tier)
+        self._remember(pipeline, question, answer)
+        return answer
+
+    def batch(self, questions: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, Dict]]:
+        """Answer {section: {key: question}}; only questions not answered before cost model calls"""
+        pipeline = self._current_pipeline()
+        answers = {section: {} for section in questions}
+        futures = {}
+        for section, section_questions in questions.items():
+            remaining = {}
+            for key, question in section_questions.items():
+                cached = self._cached(pipeline, question)
+                if cached:
+                    answers[section][key] = cached
+                    self.report.increment("engine_cache_hits")
+                else:
+                    remaining[key] = question
+            tiers = {key: classify_question(question) for key, question in remaining.items()}
+            for group in pipeline.plan(remaining):
+                future = self._executor.submit(pipeline.answer_group, section, group, tiers, self.report)
+                futures[future] = section
+
+        for future in as_completed(futures):
+            section = futures[future]
+            for key, answer in future.result().items():
+                answers[section][key] = answer
+                self._remember(pipeline, questions[section][key], answer)
+        return answers
+
+    def summary(self) -> Dict:
+        with self._lock:
+            cached = len(self._answers)
+            index_version = self.pipeline.index_version if self.pipeline else None
+        return {"index_version": index_version, "cached_answers": cached,
+                "time_to_first_token": time_to_first_token.summary(), **self.report.as_dict()}
 
-def load_documents(input_dir="/Users/dakshinsiva/Downloads/docs"):  # Using the original path from usage_example.py
-    """Load documents from a single directory"""
-    try:
-        reader = SimpleDirectoryReader(
-            input_dir=input_dir,
-            filename_as_id=True,
-            recursive=False,
-            required_exts=[".pdf", ".txt", ".doc", ".docx"],
-            exclude_hidden=True
-        )
-        documents = reader.load_data()
-        logger.info(f"Loaded {len(documents)} documents from {input_dir}")
-        return documents
-    except Exception as e:
-        logger.error(f"Document loading failed: {str(e)}")
-        return None
 
 def main():
-    # Set up logging
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s'
     )
-    logger = logging.getLogger(__name__)
 
-    # Initialize models
-    if not initialize_models():
-        logger.error("Failed to initialize models. Exiting.")
+    engine = SecurityRAG(sys.argv[1] if len(sys.argv) > 1 else DOCS_PATH)
+    try:
+        engine.refresh()
+    except Exception as e:
+        logger.error(f"Failed to load documents: {str(e)}")
         sys.exit(1)
 
-    # Load documents from single directory
-    documents = load_documents("/Users/dakshinsiva/Downloads/docs")  # Using original path
-    if not documents:
-        logger.error("Failed to load documents. Exiting.")
-        sys.exit(1)
+    while True:
+        query = input("\nEnter your security documentation question (or 'quit' to exit): ")
+        if query.lower() == 'quit':
+            logger.info(f"Engine summary: {engine.summary()}")
+            break
+        try:
+            answer = engine.query(query)
+            print(f"\nAnswer:\n{answer['result']}")
+            for doc in answer.get('source_documents', []):
+                print(f"- {doc.metadata.get('source')} (page {doc.metadata.get('page', 0) + 1})")
+        except Exception as e:
+            logger.error(f"Query failed: {str(e)}")
+
 
-    # Rest of the code remains the same...
+if __name__ == "__main__":
+    main()
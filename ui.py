@@ -1,28 +1,201 @@
 import streamlit as st
-from vision import SecurityQuestionnaire, main as process_documents
+from vision import SecurityQuestionnaire
+from security_rag import SecurityRAG
+from results_store import ResultsStore, order_records
+from job_queue import COMPLETED, QUEUED, RUNNING, JobQueue, estimate_eta, run_worker
+from export_service import EXPORT_FORMATS, ExportService
+from knowledge_base import APPROVED, KnowledgeBase
+from upload_store import UploadStore
 import os
-from datetime import datetime
-from docx import Document
-import glob
+import threading
 import time
-import pandas as pd
 from database import ResponseDatabase
 
 # Initialize database at the top of the file
 db = ResponseDatabase()
 
-# Add this function after the imports and before apply_custom_styling()
-def load_latest_docx():
-    """Load the latest generated docx file"""
-    try:
-        docx_files = glob.glob("security_questionnaire_responses_*.docx")
-        if not docx_files:
-            return None
-        latest_file = max(docx_files, key=os.path.getctime)
-        return Document(latest_file)
-    except Exception as e:
-        st.error(f"Error loading document: {str(e)}")
-        return None
+@st.cache_resource
+def get_results_store():
+    """Results store shared by every session, so a rerun does not open a new connection"""
+    return ResultsStore()
+
+results_store = get_results_store()
+
+DOCS_DIR = "docs"
+# Questions rendered per page of the Analysis Results tab
+QA_PAGE_SIZE = 10
+# Analysis jobs run by this server process at once; more are queued
+UI_WORKERS = 2
+JOB_POLL_SECONDS = 2
+# How long a click waits for its review write to be committed
+DB_WRITE_TIMEOUT_SECONDS = 10
+
+@st.cache_resource
+def get_engine():
+    """Answering engine shared by every session; its index and answers outlive reruns"""
+    return SecurityRAG(DOCS_DIR, job_id="ui")
+
+@st.cache_resource
+def get_knowledge_base():
+    """Full-text index over past runs and approved answers, shared by every session"""
+    return KnowledgeBase()
+
+@st.cache_resource
+def get_export_service():
+    """Export artifacts shared by every session, generated off the script thread"""
+    return ExportService(results_store)
+
+@st.cache_resource
+def get_upload_store():
+    """Uploaded documents, stored once per distinct content for every session"""
+    return UploadStore()
+
+def store_uploads(uploaded_files):
+    """Put this session's uploads into the upload store; returns {sha256: True if its content was new}
+
+    Each upload is hashed and stored once per session; reruns only look up
+    the hashes, and a file any session uploaded before is not written again.
+    """
+    store = get_upload_store()
+    stored = st.session_state.setdefault('uploads', {})
+    added = False
+    for file in uploaded_files:
+        if file.file_id not in stored:
+            stored[file.file_id] = store.put(file.name, file.getbuffer())
+            added = added or stored[file.file_id][1]
+    if added:
+        store.materialize(DOCS_DIR)
+    return dict(stored[file.file_id] for file in uploaded_files)
+
+@st.cache_resource
+def get_job_runner():
+    """Job queue plus in-process workers, started once per server process
+    
+    Jobs run on the workers' threads, so they survive reruns and browser
+    disconnects; standalone `job_queue.py worker` processes can share the
+    queue. Jobs over the uploads folder reuse the shared engine's index.
+    """
+    queue = JobQueue()
+    wake = threading.Event()
+    engine = get_engine()
+    docs_path = os.path.abspath(DOCS_DIR)
+    
+    def pipeline_factory(path, progress, job_id):
+        # Each job is its own batch job for the scheduler, not one shared "ui" job
+        return engine.current_pipeline(progress, job_id) if path == docs_path else None
+    
+    for i in range(UI_WORKERS):
+        threading.Thread(
+            target=run_worker, args=(queue,), name=f"ui-worker-{i}", daemon=True,
+            kwargs={"worker_id": f"ui-{os.getpid()}-{i}", "pipeline_factory": pipeline_factory, "wake": wake}
+        ).start()
+    return queue, wake
+
+def analyze_documents():
+    """Queue the questionnaire over the uploaded documents as a background job; returns its id"""
+    queue, wake = get_job_runner()
+    # Also picks up documents other sessions uploaded since this one last did
+    get_upload_store().materialize(DOCS_DIR)
+    job_id = queue.submit(DOCS_DIR, SecurityQuestionnaire().to_dict())
+    wake.set()
+    st.session_state.setdefault('jobs', []).append(job_id)
+    return job_id
+
+def format_seconds(seconds):
+    return f"{seconds / 60:.0f} min" if seconds >= 90 else f"{seconds:.0f}s"
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress():
+    """Progress of this session's analysis jobs, polled with one small query per interval"""
+    job_ids = st.session_state.get('jobs')
+    if not job_ids:
+        return
+    queue, _ = get_job_runner()
+    finished = False
+    for job in queue.status(job_ids=job_ids):
+        progress = job['progress']
+        if job['status'] == QUEUED:
+            st.info(f"⏳ Analysis #{job['id']} is queued")
+        elif job['status'] == RUNNING:
+            stage = progress.get('stage')
+            steps = [
+                f"{label} {progress[name]['done']}/{progress[name]['total']}"
+                for name, label in (("files", "files parsed"), ("chunks", "chunks embedded"),
+                                    ("questions", "questions answered"))
+                if name in progress
+            ]
+            eta = estimate_eta(job)
+            if eta is not None:
+                steps.append(f"{stage} ETA {format_seconds(eta)}")
+            st.progress(job['questions_done'] / max(job['questions_total'], 1),
+                        text=f"📊 Analysis #{job['id']}: " + (" · ".join(steps) or "starting..."))
+        else:
+            finished = True
+            st.session_state['jobs'].remove(job['id'])
+            if job['status'] == COMPLETED:
+                st.session_state['finished_job'] = (job['id'], job['result'].get('errors', 0))
+            else:
+                st.session_state['failed_job'] = (job['id'], job['error'])
+    if finished:
+        # The results tab and exports show the new run after a full rerun
+        st.rerun()
+
+def results_db_identity():
+    """(path, mtime, size) of the results database; changes whenever a run writes to it"""
+    path = os.path.join(results_store.directory, "results.db")
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_qa_sections(path, mtime_ns, size):
+    """Latest run as [(section name, [qa, ...])] in questionnaire order, shared by every session.
+    
+    The arguments only key the cache: a rerun with an unchanged results
+    database skips the query and the formatting entirely.
+    """
+    questionnaire = SecurityQuestionnaire()
+    qa_sections = []
+    for section_records in order_records(results_store.load_run(), questionnaire.questions).values():
+        qa_items = []
+        for record in section_records:
+            answer = record['answer'] or ''
+            qa_items.append({
+                "question": record['question'],
+                "answer": answer,
+                "sources": ", ".join(
+                    f"{source['source']} (Page {source['page']})" if source['page'] else source['source']
+                    for source in record['sources'] or []
+                ),
+                "search_text": f"{record['question']}\n{answer}".lower(),
+            })
+        qa_sections.append((section_records[0]['section_name'], qa_items))
+    return qa_sections
+
+def regenerate_answer(question, qa_id):
+    """Stream a fresh answer into the page token by token"""
+    result = {}
+    
+    def tokens():
+        for item in get_engine().stream(question):
+            if isinstance(item, dict):
+                result.update(item)
+            else:
+                yield item
+    
+    st.write_stream(tokens())
+    sources = ", ".join(sorted({
+        f"{os.path.basename(str(doc.metadata.get('source')))} (p. {doc.metadata.get('page', 0) + 1})"
+        for doc in result.get('source_documents', [])
+    }))
+    ttft = result.get('time_to_first_token')
+    typical = get_engine().summary()['time_to_first_token']
+    st.caption(
+        f"Sources: {sources or 'none'} · first token after {ttft:.1f}s "
+        f"(p50 {typical['p50']:.1f}s, p95 {typical['p95']:.1f}s over {typical['samples']} answers) · "
+        f"done in {result['elapsed']:.1f}s"
+        if ttft is not None else f"Sources: {sources or 'none'} · done in {result.get('elapsed', 0):.1f}s"
+    )
+    st.session_state.setdefault('regenerated', {})[qa_id] = {"answer": result.get('result', ''), "sources": sources}
 
 # Custom theme and styling
 def apply_custom_styling(theme=None):
@@ -177,8 +350,20 @@ def apply_custom_styling(theme=None):
         </style>
     """, unsafe_allow_html=True)
 
-def display_qa_section(question, answer, sources, qa_id):
-    """Display a Q&A section with database integration"""
+@st.fragment
+def display_qa_section(question, answer, sources, qa_id, response_history=None):
+    """Display a Q&A section with database integration; pass response_history when it was bulk-loaded
+    
+    Runs as a fragment: its buttons rerun only this question, not the page.
+    A fragment rerun is called with the arguments of the last full run, so
+    it reloads the history instead of trusting the bulk-loaded one.
+    """
+    # Full runs are counted in main(); a second call within the same full run is a fragment rerun
+    rendered = st.session_state.setdefault('history_rendered', {})
+    if rendered.get(qa_id) == st.session_state.get('page_runs'):
+        response_history = None
+    rendered[qa_id] = st.session_state.get('page_runs')
+    
     with st.container():
         # Question container with white background and border
         st.markdown("""
@@ -199,7 +384,13 @@ def display_qa_section(question, answer, sources, qa_id):
         """, unsafe_allow_html=True)
         
         # Get response history
-        response_history = db.get_response_history(qa_id)
+        if response_history is None:
+            response_history = db.get_response_history(qa_id)
+        
+        # A regenerated answer replaces the one from the analysis document
+        regenerated = st.session_state.get('regenerated', {}).get(qa_id)
+        if regenerated:
+            answer, sources = regenerated["answer"], regenerated["sources"]
         
         if answer:
             st.markdown(f"""
@@ -224,7 +415,8 @@ def display_qa_section(question, answer, sources, qa_id):
                         response="Yes",
                         sources=sources
                     )
-                    st.success("Response saved!")
+                    response_history = None
+                    response_id = confirm_write(response_id, "Response saved!")
             
             with col2:
                 if st.button("✕ No", key=f"no_{qa_id}"):
@@ -235,15 +427,20 @@ def display_qa_section(question, answer, sources, qa_id):
                         response="No",
                         sources=sources
                     )
-                    st.success("Response saved!")
+                    response_history = None
+                    response_id = confirm_write(response_id, "Response saved!")
             
             # Action buttons with database integration
-            cols = st.columns([1, 1, 1, 3])
+            cols = st.columns([1, 1, 1, 1, 2])
             with cols[0]:
                 if st.button("✓ Apply", key=f"apply_{qa_id}", type="primary"):
-                    if response_history:
-                        db.update_response(response_history[0][0], "Applied")
-                        st.success("Response applied!")
+                    # The newest response, even one saved by an earlier click in this fragment
+                    latest = db.get_response_history(qa_id)
+                    if latest:
+                        response_history = None
+                        confirm_write(db.update_response(latest[0][0], "Applied"), "Response applied!")
+                    else:
+                        st.warning("Mark the answer as correct or incorrect before applying it.")
             
             with cols[1]:
                 st.button("📎 Attach", key=f"attach_{qa_id}")
@@ -251,6 +448,19 @@ def display_qa_section(question, answer, sources, qa_id):
             with cols[2]:
                 st.button("👤 Assign", key=f"assign_{qa_id}")
             
+            with cols[3]:
+                regenerate = st.button("↻ Regenerate", key=f"regenerate_{qa_id}")
+            
+            if regenerate:
+                try:
+                    regenerate_answer(question, qa_id)
+                except Exception as e:
+                    st.error(f"Error regenerating answer: {str(e)}")
+            
+            # A fragment rerun keeps the bulk-loaded history, so reload it after this question's own writes
+            if response_history is None:
+                response_history = db.get_response_history(qa_id)
+            
             # Show response history
             if response_history:
                 with st.expander("View Response History"):
@@ -264,12 +474,50 @@ def display_qa_section(question, answer, sources, qa_id):
         
         st.markdown("</div>", unsafe_allow_html=True)
 
-def show_progress_bar():
-    progress_bar = st.progress(0)
-    for i in range(100):
-        time.sleep(0.01)
-        progress_bar.progress(i + 1)
-    return progress_bar
+def render_results_page(qa_sections, search_query):
+    """Render one page of one section; the rest of the run costs no widgets"""
+    sections = {}
+    for section_name, qa_items in qa_sections:
+        # Only display questions matching the search query
+        matching = [qa for qa in qa_items if not search_query or search_query in qa['search_text']]
+        if matching:
+            sections[section_name] = matching
+    if not sections:
+        st.info("🔍 No questions match your search.")
+        return
+    
+    nav_col, page_col = st.columns([3, 1])
+    with nav_col:
+        section_name = st.selectbox(
+            "Section", list(sections), key="results_section",
+            format_func=lambda name: f"{name} ({len(sections[name])})"
+        )
+    qa_items = sections[section_name]
+    pages = (len(qa_items) + QA_PAGE_SIZE - 1) // QA_PAGE_SIZE
+    with page_col:
+        page = st.selectbox("Page", range(1, pages + 1), key=f"results_page_{section_name}",
+                            format_func=lambda p: f"{p} of {pages}") if pages > 1 else 1
+    
+    st.markdown(f"""
+        <div class='section-header'>
+            <h2 style='color: #1e3c72; margin: 0;'>{section_name.upper()}</h2>
+        </div>
+    """, unsafe_allow_html=True)
+    visible = qa_items[(page - 1) * QA_PAGE_SIZE:page * QA_PAGE_SIZE]
+    # One query for the review history of every question on the page
+    histories = db.get_response_histories(qa['question'] for qa in visible)
+    for qa in visible:
+        display_qa_section(qa['question'], qa['answer'], qa['sources'], qa['question'], histories[qa['question']])
+
+def confirm_write(future, message):
+    """Wait for a queued database write and report it; returns the row id, or None if it failed"""
+    try:
+        row_id = future.result(timeout=DB_WRITE_TIMEOUT_SECONDS)
+    except Exception as e:
+        st.error(f"Could not save your response: {str(e) or type(e).__name__}")
+        return None
+    st.success(message)
+    return row_id
 
 def copy_button(text, button_id):
     """Add a copy button for text content"""
@@ -278,24 +526,24 @@ def copy_button(text, button_id):
         st.success("Text copied to clipboard!")
 
 def add_feedback_system(qa_id, response_id):
-    """Add feedback buttons with database integration"""
+    """Add feedback buttons with database integration
+
+    response_id is a saved row id, e.g. what confirm_write returned, not the Future from save_response.
+    """
     col1, col2, col3 = st.columns(3)
     with col1:
         if st.button("👍 Helpful", key=f"helpful_{qa_id}"):
-            db.save_feedback(response_id, "helpful")
-            st.success("Thank you for your feedback!")
+            confirm_write(db.save_feedback(response_id, "helpful"), "Thank you for your feedback!")
     with col2:
         if st.button("👎 Not Helpful", key=f"not_helpful_{qa_id}"):
             feedback = st.text_area("How can we improve?", key=f"feedback_{qa_id}")
             if st.button("Submit Feedback"):
-                db.save_feedback(response_id, "not_helpful", feedback)
-                st.success("Thank you for your feedback!")
+                confirm_write(db.save_feedback(response_id, "not_helpful", feedback), "Thank you for your feedback!")
     with col3:
         if st.button("⚠️ Report Issue", key=f"report_{qa_id}"):
             issue = st.text_area("Describe the issue:", key=f"issue_{qa_id}")
             if st.button("Submit Report"):
-                db.save_feedback(response_id, "issue", issue)
-                st.success("Issue reported!")
+                confirm_write(db.save_feedback(response_id, "issue", issue), "Issue reported!")
 
 def add_theme_toggle():
     """Add theme toggle in sidebar"""
@@ -308,88 +556,80 @@ def add_theme_toggle():
         return theme
 
 def add_export_options():
-    """Add export options for the analysis"""
+    """Offer the latest finished run as Word, Excel and CSV downloads"""
     with st.sidebar:
         st.markdown("### 📤 Export Options")
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("📄 Export PDF"):
-                st.download_button(
-                    label="Download PDF",
-                    data=generate_pdf(),  # You'll need to implement this
-                    file_name="analysis.pdf",
-                    mime="application/pdf"
-                )
-        with col2:
-            if st.button("📊 Export Excel"):
-                st.download_button(
-                    label="Download Excel",
-                    data=generate_excel(),  # You'll need to implement this
-                    file_name="analysis.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-
-def generate_pdf():
-    """Generate PDF from analysis results"""
-    try:
-        # Get the latest docx file
-        docx_files = glob.glob("security_questionnaire_responses_*.docx")
-        if not docx_files:
-            return None
-        latest_file = max(docx_files, key=os.path.getctime)
+        # A run still in progress changes with every answer, and its artifacts with it
+        run_id = results_store.latest_run_id(finished_only=True)
+        if run_id is None:
+            st.caption("Run an analysis to export its results.")
+            return
         
-        # Read the file as bytes
-        with open(latest_file, 'rb') as f:
-            return f.read()
-    except Exception as e:
-        st.error(f"Error generating PDF: {str(e)}")
-        return None
+        # Artifacts are generated in the background and cached per run version,
+        # so this rerun only starts the ones that are missing
+        service = get_export_service()
+        questions = SecurityQuestionnaire().questions
+        pending = []
+        for fmt, label in (("docx", "📄 Word"), ("xlsx", "📊 Excel"), ("csv", "🧾 CSV")):
+            future = service.submit(run_id, fmt, questions)
+            if not future.done():
+                st.caption(f"{label} export is being prepared...")
+                pending.append(future)
+            elif future.exception() is not None:
+                st.error(f"Error generating {label} export: {str(future.exception())}")
+            else:
+                with open(future.result(), 'rb') as f:
+                    st.download_button(
+                        label=f"Download {label}",
+                        data=f.read(),
+                        file_name=f"security_questionnaire_{run_id}.{fmt}",
+                        mime=EXPORT_FORMATS[fmt],
+                        key=f"export_{fmt}"
+                    )
+        if pending:
+            wait_for_exports(pending)
 
-def generate_excel():
-    """Generate Excel from analysis results"""
-    try:
-        # Get the latest docx file
-        docx_files = glob.glob("security_questionnaire_responses_*.docx")
-        if not docx_files:
-            return None
-            
-        doc = Document(max(docx_files, key=os.path.getctime))
-        data = []
-        
-        for para in doc.paragraphs:
-            if "Question:" in para.text:
-                data.append({"Question": para.text.replace("Question:", "").strip()})
-            elif "Answer:" in para.text and data:
-                data[-1]["Answer"] = para.text.replace("Answer:", "").strip()
-                
-        df = pd.DataFrame(data)
-        return df.to_excel(index=False).encode()
-    except Exception as e:
-        st.error(f"Error generating Excel: {str(e)}")
-        return None
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def wait_for_exports(futures):
+    """Rerun once the exports being prepared are ready, so their download buttons appear on their own"""
+    if all(future.done() for future in futures):
+        st.rerun()
 
 def add_knowledge_base():
+    """Ranked full-text search over every past run and approved answer"""
+    knowledge_base = get_knowledge_base()
+    # Indexes only runs and approvals that are new since the last rerun
+    knowledge_base.refresh(results_store, db)
     with st.sidebar:
         st.markdown("""
             <div class='knowledge-base'>
                 <h3>Search the Knowledge Base</h3>
-                <div class='search-results'>
-                    <p>Results (20)</p>
-                    <div style='margin-top: 1rem;'>
-                        <p><strong>From past completed questionnaires</strong></p>
-                        <!-- Add search results here -->
-                    </div>
-                </div>
             </div>
         """, unsafe_allow_html=True)
+        query = st.text_input("Search past questionnaires", key="knowledge_base_search",
+                              placeholder="e.g. encryption key rotation")
+        if not query:
+            return
+        results = knowledge_base.search(query)
+        st.markdown(f"""
+            <div class='search-results'>
+                <p>Results ({len(results)})</p>
+            </div>
+        """, unsafe_allow_html=True)
+        for result in results:
+            origin = "✅ Approved answer" if result['kind'] == APPROVED else f"📄 Run {result['ref']} · {result['section_name']}"
+            st.markdown(f"**{result['question']}**  \n{result['snippet']}")
+            st.caption(f"{origin} · {result['updated_at']}")
 
 def main():
+    rerun_started = time.perf_counter()
     st.set_page_config(
         page_title="Security Documentation Analyzer",
         page_icon="🔒",
         layout="wide",
         initial_sidebar_state="expanded"
     )
+    st.session_state['page_runs'] = st.session_state.get('page_runs', 0) + 1
     
     # Add theme toggle
     theme = add_theme_toggle()
@@ -423,28 +663,31 @@ def main():
         )
         
         if uploaded_files:
-            save_path = "docs"
-            os.makedirs(save_path, exist_ok=True)
+            uploads = store_uploads(uploaded_files)
             
             st.markdown("### 📁 Uploaded Files")
-            for file in uploaded_files:
+            for document in get_upload_store().documents():
+                if document['sha256'] not in uploads:
+                    continue
+                note = "" if uploads[document['sha256']] else " <small>(already stored)</small>"
                 st.markdown(f"""
                     <div class='uploadedFile'>
-                        <span style='color: #1e3c72;'>📄</span> {file.name}
+                        <span style='color: #1e3c72;'>📄</span> {document['file_name']}{note}
                     </div>
                 """, unsafe_allow_html=True)
-                
-                file_path = os.path.join(save_path, file.name)
-                with open(file_path, "wb") as f:
-                    f.write(file.getbuffer())
             
             if st.button("🔍 Analyze Documents", use_container_width=True):
-                progress_bar = show_progress_bar()
-                with st.spinner("📊 Processing documents..."):
-                    process_documents()
-                progress_bar.empty()
-                st.success("✅ Analysis complete!")
-                st.balloons()
+                job_id = analyze_documents()
+                st.toast(f"Analysis #{job_id} queued")
+        
+        show_job_progress()
+        if 'finished_job' in st.session_state:
+            job_id, errors = st.session_state.pop('finished_job')
+            st.success(f"✅ Analysis #{job_id} complete!" + (f" ({errors} questions could not be answered)" if errors else ""))
+            st.balloons()
+        if 'failed_job' in st.session_state:
+            job_id, error = st.session_state.pop('failed_job')
+            st.error(f"Analysis #{job_id} failed: {error}")
 
     # Main content tabs
     tab1, tab2 = st.tabs(["📊 Analysis Results", "📝 Questions Database"])
@@ -453,36 +696,9 @@ def main():
         # Add single search bar at the top
         search_query = st.text_input("🔍 Search questions and answers...", key="global_search").lower()
         
-        doc = load_latest_docx()
-        if doc:
-            current_section = None
-            qa_data = {"question": "", "answer": "", "sources": ""}
-            
-            for para in doc.paragraphs:
-                text = para.text.strip()
-                if text:
-                    if "=" * 20 in text:
-                        if current_section:
-                            st.markdown("---")
-                        current_section = text.replace("=", "").strip()
-                        st.markdown(f"""
-                            <div class='section-header'>
-                                <h2 style='color: #1e3c72; margin: 0;'>{current_section}</h2>
-                            </div>
-                        """, unsafe_allow_html=True)
-                    elif "Question:" in text:
-                        if qa_data["question"]:
-                            # Only display if matches search query
-                            if not search_query or search_query in qa_data["question"].lower() or search_query in qa_data["answer"].lower():
-                                display_qa_section(qa_data["question"], qa_data["answer"], qa_data["sources"], qa_data["question"])
-                            qa_data = {"question": "", "answer": "", "sources": ""}
-                        qa_data["question"] = text.replace("Question:", "").strip()
-                    elif "Answer:" in text:
-                        qa_data["answer"] = text.replace("Answer:", "").strip()
-                    elif "Source Documents:" in text:
-                        qa_data["sources"] = text.replace("Source Documents:", "").strip()
-                        display_qa_section(qa_data["question"], qa_data["answer"], qa_data["sources"], qa_data["question"])
-                        qa_data = {"question": "", "answer": "", "sources": ""}
+        qa_sections = load_qa_sections(*results_db_identity())
+        if qa_sections:
+            render_results_page(qa_sections, search_query)
         else:
             st.info("🔍 No analysis results available. Please upload documents and run the analysis.")
 
@@ -508,6 +724,13 @@ def main():
 
     # Add knowledge base
     add_knowledge_base()
+    
+    # Full-script rerun time; clicks inside a question's fragment do not rerun the script
+    rerun_ms = (time.perf_counter() - rerun_started) * 1000
+    timings = st.session_state.setdefault('rerun_ms', [])
+    timings.append(rerun_ms)
+    del timings[:-20]
+    st.sidebar.caption(f"⏱ Rerun took {rerun_ms:.0f} ms (median of last {len(timings)}: {sorted(timings)[len(timings) // 2]:.0f} ms)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+UPLOADS_DIR = os.getenv("RAG_UPLOADS_DIR", "uploads")
+# Written into every docs view: {file name: sha256 of its content}
+MANIFEST_NAME = ".manifest.json"
+
+
+def content_hash(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_file(path: str, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_manifest(docs_path: str) -> Dict[str, str]:
+    """Content hashes of the files in a docs view built by UploadStore.materialize; {} for other folders"""
+    try:
+        with open(os.path.join(docs_path, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class UploadStore:
+    """Uploaded documents, stored once per distinct content.
+
+    Files are kept as blobs/<sha256[:2]>/<sha256> and indexed in uploads.db,
+    so the same document uploaded again, under any name, by any user, costs
+    a hash and no write. Two different documents with the same name are both
+    kept, the later one under a name with a short hash suffix. materialize()
+    lays the documents out as a folder the ingestion code reads, together
+    with a manifest of their content hashes.
+    """
+
+    def __init__(self, directory: str = UPLOADS_DIR):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, "uploads.db"), check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        # Reentrant: materialize() reads documents() while holding it
+        self._lock = threading.RLock()
+        self.create_tables()
+
+    def create_tables(self):
+        with self._lock:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS documents (
+                    sha256 TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self.conn.commit()
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, "blobs", sha256[:2], sha256)
+
+    def put(self, name: str, data) -> Tuple[str, bool]:
+        """Store an upload; returns (sha256, True if its content was new)"""
+        sha256 = content_hash(data)
+        path = self.blob_path(sha256)
+        with self._lock:
+            created = not os.path.exists(path)
+            if created:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                created = self._publish(path, lambda partial: _write_file(partial, data))
+            self.conn.execute('''
+                INSERT OR IGNORE INTO documents (sha256, name, size) VALUES (?, ?, ?)
+            ''', (sha256, os.path.basename(name), len(data)))
+            self.conn.commit()
+        if created:
+            logger.info(f"Stored upload {name} as {sha256[:12]}")
+        return sha256, created
+
+    @staticmethod
+    def _publish(path: str, write) -> bool:
+        """Create `path` from a partial file written by write(partial); False if another writer got there first
+
+        The partial file is hard-linked into place, which fails instead of
+        overwriting when `path` already exists, so of two processes storing
+        the same content only one wins.
+        """
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.partial"
+        write(partial)
+        try:
+            os.link(partial, path)
+        except FileExistsError:
+            return False
+        except OSError:
+            # Filesystems without hard links: same content either way, so replacing is harmless
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return True
+
+    def documents(self) -> List[Dict[str, Any]]:
+        """Stored documents, oldest first, each with the file name it gets in a docs view"""
+        with self._lock:
+            rows = [dict(row) for row in self.conn.execute('SELECT * FROM documents ORDER BY uploaded_at, rowid')]
+        # The first document with a name keeps it; later ones with different content get a hash suffix
+        taken = set()
+        for row in rows:
+            if row["name"] in taken:
+                stem, extension = os.path.splitext(row["name"])
+                row["file_name"] = f"{stem}-{row['sha256'][:8]}{extension}"
+            else:
+                row["file_name"] = row["name"]
+                taken.add(row["name"])
+        return rows
+
+    def materialize(self, docs_path: str) -> Dict[str, str]:
+        """Make docs_path hold every stored document, as hard links where possible; returns the manifest
+
+        Only files this store placed there before are replaced or removed;
+        anything else in the folder is left alone.
+        """
+        # Sessions sharing this store lay out the folder one at a time
+        with self._lock:
+            os.makedirs(docs_path, exist_ok=True)
+            previous = read_manifest(docs_path)
+            wanted = {row["file_name"]: row["sha256"] for row in self.documents()}
+            if wanted == previous:
+                return wanted
+
+            for file_name, sha256 in previous.items():
+                if wanted.get(file_name) != sha256:
+                    try:
+                        os.remove(os.path.join(docs_path, file_name))
+                    except FileNotFoundError:
+                        pass
+            for file_name, sha256 in wanted.items():
+                target = os.path.join(docs_path, file_name)
+                if previous.get(file_name) == sha256 and os.path.exists(target):
+                    continue
+                # Linked or copied under a temporary name and renamed over the target in one step
+                partial = f"{target}.{os.getpid()}.{threading.get_ident()}.partial"
+                try:
+                    os.link(self.blob_path(sha256), partial)
+                except OSError:
+                    shutil.copyfile(self.blob_path(sha256), partial)
+                os.replace(partial, target)
+                if os.path.exists(partial):
+                    # rename() leaves both names when the target already links the same blob
+                    os.remove(partial)
+
+            partial = os.path.join(docs_path, f"{MANIFEST_NAME}.{os.getpid()}.{threading.get_ident()}.partial")
+            with open(partial, 'w', encoding='utf-8') as f:
+                json.dump(wanted, f, indent=2, sort_keys=True)
+            os.replace(partial, os.path.join(docs_path, MANIFEST_NAME))
+        logger.info(f"Docs view {docs_path} now holds {len(wanted)} documents")
+        return wanted
+
+
+class ParseCache:
+    """Parsed pages of documents, keyed by content hash, so a known document is never parsed twice
+
+    Pages are stored as {"page_content", "metadata"} dicts; callers rebuild
+    their own document objects and set the file path they loaded from.
+    """
+
+    def __init__(self, directory: str = os.path.join(UPLOADS_DIR, "parsed")):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.directory, f"{sha256}.json")
+
+    def get(self, sha256: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with open(self._path(sha256), encoding='utf-8') as f:
+                pages = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pages
+
+    def put(self, sha256: str, pages: List[Dict[str, Any]]):
+        partial = f"{self._path(sha256)}.{threading.get_ident()}.partial"
+        with open(partial, 'w', encoding='utf-8') as f:
+            json.dump(pages, f, default=str)
+        os.replace(partial, self._path(sha256))
+
+    def summary(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
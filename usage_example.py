@@ -13,12 +13,21 @@ from llama_index.core.prompts import PromptTemplate
 from dotenv import load_dotenv
 import os
 from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI  # Updated import
+from llama_index.core.llms import ChatMessage, ChatResponse, ChatResponseGen, CompletionResponse, CompletionResponseGen
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from generation_client import DeadlineExceeded, GenerationClient, LatencyTracker
+from ollama_backend import OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE, OLLAMA_MODEL, get_ollama_backend
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Overall per-query deadline. Hedging stays off: a duplicate request would only
+# compete with the original for the same local model.
+QUERY_DEADLINE_SECONDS = 180
+query_client = GenerationClient("query", deadline=QUERY_DEADLINE_SECONDS, hedge=False)
+time_to_first_token = LatencyTracker()
+
 # Custom QA prompt template
 
 # Update the QA template to better match security audit questions
@@ -96,31 +105,84 @@ CYBERSEC_QA_TEMPLATE = PromptTemplate(
     - How is data encrypted at rest and in transit?
 """
 
+class ScheduledOllama(Ollama):
+    """Ollama LLM that sends requests through the shared, slot-scheduled backend"""
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponse:
+        raw = get_ollama_backend().generate(prompt, options=self._model_kwargs)
+        return CompletionResponse(text=raw.get("response", ""), raw=raw)
+
+    @llm_chat_callback()
+    def chat(self, messages, **kwargs) -> ChatResponse:
+        raw = get_ollama_backend().chat(
+            [{"role": m.role.value, "content": m.content} for m in messages],
+            options=self._model_kwargs
+        )
+        message = raw.get("message", {})
+        return ChatResponse(
+            message=ChatMessage(role=message.get("role", "assistant"), content=message.get("content", "")),
+            raw=raw
+        )
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponseGen:
+        def gen():
+            text = ""
+            for chunk in get_ollama_backend().stream_generate(prompt, options=self._model_kwargs):
+                delta = chunk.get("response", "")
+                text += delta
+                yield CompletionResponse(text=text, delta=delta, raw=chunk)
+        return gen()
+
+    @llm_chat_callback()
+    def stream_chat(self, messages, **kwargs) -> ChatResponseGen:
+        def gen():
+            content = ""
+            for chunk in get_ollama_backend().stream_chat(
+                [{"role": m.role.value, "content": m.content} for m in messages],
+                options=self._model_kwargs
+            ):
+                message = chunk.get("message", {})
+                delta = message.get("content", "")
+                content += delta
+                yield ChatResponse(
+                    message=ChatMessage(role=message.get("role", "assistant"), content=content),
+                    delta=delta,
+                    raw=chunk
+                )
+        return gen()
+
 def check_ollama_health():
-    """Check if Ollama is running and the model is available"""
-    try:
-        llm = Ollama(model="llama2", timeout=60)  # Increased timeout
-        # Simple test prompt
-        response = llm.complete("Test")
-        return True
-    except Exception as e:
-        logger.error(f"Ollama health check failed: {str(e)}")
+    """Check that Ollama is reachable and the model is installed, without generating"""
+    backend = get_ollama_backend()
+    if not backend.is_alive():
         return False
+    if not backend.model_available():
+        logger.error(f"Ollama is running but model {OLLAMA_MODEL} is not installed (ollama pull {OLLAMA_MODEL})")
+        return False
+    return True
 
 def initialize_models():
     """Initialize LLM and embedding models with proper error handling"""
     try:
         # Initialize with optimized settings
-        Settings.llm = Ollama(
-            model="llama2",
+        Settings.llm = ScheduledOllama(
+            model=OLLAMA_MODEL,
             timeout=120,
             temperature=0.3,
             context_window=2048,  # Reduced from 4096 for better speed
             request_timeout=120.0,
             num_retries=3,
-            base_url="http://localhost:11434",
+            base_url=OLLAMA_BASE_URL,
+            keep_alive=OLLAMA_KEEP_ALIVE,
         )
         
+        # Load the model now so the first query does not pay the cold start
+        backend = get_ollama_backend()
+        if not backend.is_loaded():
+            backend.warm_up()
+        
         return True
     except Exception as e:
         logger.error(f"Model initialization failed: {str(e)}")
@@ -153,15 +215,8 @@ def create_index(documents):
             api_key=os.getenv("OPENAI_API_KEY")
         )
 
-        # Create LLM
-        llm = OpenAI(
-            model="gpt-3.5-turbo",
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-
-        # Configure both embedding model and LLM
+        # Only the embedding model; queries are answered by the ScheduledOllama set in initialize_models
         Settings.embed_model = embed_model
-        Settings.llm = llm
 
         # Create index
         index = VectorStoreIndex.from_documents(documents)
@@ -171,15 +226,36 @@ def create_index(documents):
         logger.error(f"Index creation failed: {str(e)}")
         return None
 
+def tokens_until(tokens, deadline_at):
+    """Yield streamed tokens until the deadline, then stop generation and raise DeadlineExceeded
+
+    The deadline is checked as each token arrives: a stream that stalls
+    without sending tokens is only cut off by Ollama's request timeout.
+    """
+    try:
+        for token in tokens:
+            yield token
+            if time.perf_counter() > deadline_at:
+                raise DeadlineExceeded(f"query exceeded its {QUERY_DEADLINE_SECONDS:.0f}s deadline while generating")
+    finally:
+        # Closing the token generator closes the Ollama stream and frees its slot
+        if hasattr(tokens, "close"):
+            tokens.close()
+
 def query_index(index, query_text):
-    """Query the index and return response"""
+    """Query the index and return a streaming response; tokens arrive on response.response_gen"""
     try:
         # Create query engine with response synthesis
         query_engine = index.as_query_engine(
             response_mode="compact",  # or "tree_summarize" for longer responses
-            streaming=False
+            streaming=True
         )
-        response = query_engine.query(query_text)
+        # query() returns once retrieval is done and generation has started; the
+        # tokens are generated while the caller reads them, so the same deadline
+        # is applied to response_gen as well
+        deadline_at = time.perf_counter() + query_client.deadline
+        response = query_client.call(query_engine.query, query_text)
+        response.response_gen = tokens_until(response.response_gen, deadline_at)
         return response
     except Exception as e:
         logger.error(f"Query failed: {str(e)}")
@@ -213,14 +289,26 @@ def main():
         try:
             query = input("\nEnter your security documentation question (or 'quit' to exit): ")
             if query.lower() == 'quit':
+                logger.info(f"Ollama scheduler: {get_ollama_backend().summary()}")
+                logger.info(f"Time to first token: {time_to_first_token.summary()}")
                 break
 
             logger.info("Processing query...")
+            started = time.perf_counter()
             response = query_index(index, query)
             
-            # Display results with source attribution
+            # Print tokens as they arrive, then the sources once generation is done
             print("\nAnswer:")
-            print(response.response)
+            first_token = None
+            for token in response.response_gen:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                    time_to_first_token.add(first_token)
+                print(token, end="", flush=True)
+            print()
+            if first_token is not None:
+                logger.info(f"First token after {first_token:.2f}s, answer complete after {time.perf_counter() - started:.2f}s")
+            logger.info(f"Ollama requests served so far: {get_ollama_backend().summary()['requests']}")
             print("\nSources:")
             for node in response.source_nodes:
                 print(f"\nFrom document: {node.node.metadata.get('file_name', 'Unknown')}")
@@ -228,6 +316,9 @@ def main():
                 print("Relevant excerpt:")
                 print(f"'{node.node.text[:200]}...'")  # Show first 200 chars of context
 
+        except DeadlineExceeded as e:
+            print()
+            logger.error(f"Answer cut off: {str(e)}")
         except Exception as e:
             logger.error(f"Query processing failed: {str(e)}")
             print("An error occurred. Please try again.")
@@ -1,19 +1,41 @@
 import os
 import logging
 from dotenv import load_dotenv
-from typing import List, Dict, Optional, Union
-import datetime
+from typing import Callable, List, Dict, Optional, Union
+import copy
+import hashlib
+import itertools
+import threading
+import time
+import uuid
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings
 from langchain.chains import RetrievalQA
+from langchain.chains.retrieval_qa.prompt import PROMPT as STUFF_PROMPT
+from langchain.retrievers import ContextualCompressionRetriever
 from langchain_openai import ChatOpenAI
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+from langchain_community.callbacks import get_openai_callback
+from langchain_core.embeddings import Embeddings
 from functools import lru_cache
-import streamlit as st
+from context_compression import ExtractiveContextCompressor, CompressionStats, estimate_tokens
+from run_report import RunReport
+from question_batching import BatchAnswerer, group_questions
+from question_router import SHORT, NARRATIVE, classify_question, classify_questionnaire
+from answer_cache import ApprovedAnswerCache
+from database import ResponseDatabase
+from single_flight import SingleFlight, normalize_question
+from generation_client import DeadlineExceeded, GenerationClient, LatencyTracker, current_attempt
+from rate_limiter import get_rate_limiter
+from model_scheduler import BATCH, call_priority
+from checkpoint_store import CheckpointStore
+from results_store import ResultsStore, result_record
+from report_renderer import ReportRenderer, render_records
+from upload_store import ParseCache, file_hash, read_manifest
+from langchain_core.documents import Document
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -41,7 +63,109 @@ MAX_TOKENS_PER_REQUEST = 4096
 RESPONSE_TOKEN_LIMIT = 1000
 BATCH_EMBEDDING_SIZE = 100  # documents per batch
 
-embeddings = OpenAIEmbeddings()
+# Context Compression (set RAG_COMPRESSION=0 to benchmark without it)
+COMPRESSION_ENABLED = os.getenv("RAG_COMPRESSION", "1") != "0"
+COMPRESSION_MAX_SENTENCES = 6  # sentences kept across all retrieved chunks
+COMPRESSION_MIN_SCORE = 0.0
+
+# Batched Answering (groups of up to BATCH_SIZE related yes/no questions per LLM call)
+BATCH_ANSWERING_ENABLED = os.getenv("RAG_BATCH_ANSWERING", "1") != "0"
+
+# Tiered Model Routing (short-form questions go to a cheaper model with a tight token limit)
+SHORT_ANSWER_MODEL = os.getenv("RAG_SHORT_MODEL", "gpt-4o-mini")
+SHORT_ANSWER_TOKEN_LIMIT = 200
+
+# Approved Answer Cache (reuse reviewer-approved answers for near-identical questions)
+ANSWER_CACHE_ENABLED = os.getenv("RAG_ANSWER_CACHE", "1") != "0"
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+
+# Documents answered against when no other path is given
+DOCS_PATH = "/Users/dakshinsiva/final_RAG/docs"
+
+# Request Deadlines and Hedging (duplicate slow requests after the observed p95 latency)
+REQUEST_DEADLINE_SECONDS = 90
+HEDGING_ENABLED = os.getenv("RAG_HEDGING", "1") != "0"
+HEDGE_PERCENTILE = 95
+
+# Parsed pages of every document, keyed by content hash, reused across rebuilds and uploads
+PARSE_CACHE_ENABLED = os.getenv("RAG_PARSE_CACHE", "1") != "0"
+
+class SharedEmbeddings(Embeddings):
+    """Embeddings wrapper that coalesces identical in-flight query embeddings"""
+    
+    def __init__(self, base: Embeddings, flights: SingleFlight):
+        self.base = base
+        self.flights = flights
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), BATCH_EMBEDDING_SIZE):
+            batch = texts[i:i + BATCH_EMBEDDING_SIZE]
+            vectors.extend(get_rate_limiter().run(
+                self.base.embed_documents, batch,
+                estimated_tokens=sum(estimate_tokens(t) for t in batch)
+            ))
+        return vectors
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.flights.do(
+            text, get_rate_limiter().run, self.base.embed_query, text,
+            estimated_tokens=estimate_tokens(text)
+        )
+
+class RateLimitedChatOpenAI(ChatOpenAI):
+    """ChatOpenAI whose requests go through the process-wide rate limiter"""
+    
+    def _estimate_tokens(self, messages, kwargs) -> int:
+        estimated = sum(estimate_tokens(str(m.content)) for m in messages)
+        return estimated + (kwargs.get("max_tokens") or self.max_tokens or RESPONSE_TOKEN_LIMIT)
+    
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return get_rate_limiter().run(
+            self._generate_within_deadline, messages, stop=stop, run_manager=run_manager,
+            estimated_tokens=self._estimate_tokens(messages, kwargs), **kwargs
+        )
+    
+    def _generate_within_deadline(self, messages, **kwargs):
+        attempt = current_attempt()
+        if attempt is not None:
+            # A request never outlives the deadline of the call it was made for, won or lost
+            kwargs["timeout"] = max(1.0, attempt.remaining())
+        return super()._generate(messages, **kwargs)
+    
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield from get_rate_limiter().stream(
+            super()._stream, messages, stop=stop, run_manager=run_manager,
+            estimated_tokens=self._estimate_tokens(messages, kwargs), **kwargs
+        )
+
+# Process-wide single-flight groups, shared by every run in this process
+question_flights = SingleFlight("questions")
+embedding_flights = SingleFlight("embeddings")
+
+# Throttling, timeouts, connection errors and 5xx responses are retried by the shared rate limiter rather than inside the OpenAI clients
+embeddings = SharedEmbeddings(OpenAIEmbeddings(max_retries=0), embedding_flights)
+
+# Created on first use, so importing this module does not touch the filesystem
+_parse_cache: Optional[ParseCache] = None
+_parse_cache_lock = threading.Lock()
+
+def get_parse_cache() -> ParseCache:
+    """The parse cache shared by every load_documents call in this process"""
+    global _parse_cache
+    with _parse_cache_lock:
+        if _parse_cache is None:
+            _parse_cache = ParseCache()
+        return _parse_cache
+
+# Time to first token of streamed answers
+time_to_first_token = LatencyTracker()
+
+# One client per kind of call so each hedges against its own latency distribution
+generation_clients = {
+    name: GenerationClient(name, deadline=REQUEST_DEADLINE_SECONDS, hedge=HEDGING_ENABLED, hedge_percentile=HEDGE_PERCENTILE)
+    for name in (SHORT, NARRATIVE, "batch")
+}
 
 class SecurityQuestionnaire:
     def __init__(self):
@@ -203,215 +327,526 @@ class SecurityQuestionnaire:
 
     def get_questions_by_section(self, section_key):
         return self.questions.get(section_key, {})
+    
+    def to_dict(self) -> Dict:
+        return {"sections": self.sections, "questions": self.questions}
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SecurityQuestionnaire":
+        """Questionnaire with the sections and questions of a to_dict() snapshot"""
+        questionnaire = cls()
+        questionnaire.sections = data["sections"]
+        questionnaire.questions = data["questions"]
+        return questionnaire
 
 @lru_cache(maxsize=1000)
 def get_embedding(text: str) -> List[float]:
     return embeddings.embed_query(text)
 
-def write_formatted_results(results, questionnaire):
-    """Write formatted results to both text and Word files with evaluation"""
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S")
-    txt_output = f"security_questionnaire_responses_{timestamp}.txt"
-    docx_output = f"security_questionnaire_responses_{timestamp}.docx"
+def write_formatted_results(run_id: str, questionnaire, output_dir: Optional[str] = None,
+                            store: Optional[ResultsStore] = None):
+    """Render a stored run as text and Word files; returns (txt path, docx path)"""
+    records = (store or ResultsStore()).load_run(run_id)
+    paths = render_records(records, questionnaire, output_dir)
+    return paths["txt"], paths["docx"]
+
+def build_tier_llms() -> Dict[str, ChatOpenAI]:
+    """Build the chat model used by each routing tier"""
+    return {
+        SHORT: RateLimitedChatOpenAI(model=SHORT_ANSWER_MODEL, temperature=0, max_tokens=SHORT_ANSWER_TOKEN_LIMIT,
+                                     timeout=REQUEST_DEADLINE_SECONDS, max_retries=0),
+        NARRATIVE: RateLimitedChatOpenAI(temperature=0, max_tokens=RESPONSE_TOKEN_LIMIT,
+                                         timeout=REQUEST_DEADLINE_SECONDS, max_retries=0),
+    }
+
+def build_tier_chains(retriever, llms: Optional[Dict[str, ChatOpenAI]] = None) -> Dict[str, RetrievalQA]:
+    """Build one retrieval chain per routing tier"""
+    llms = llms or build_tier_llms()
+    return {
+        # Short answers need a single "stuff" call, narrative ones keep the refine chain
+        SHORT: RetrievalQA.from_chain_type(
+            llm=llms[SHORT],
+            chain_type="stuff",
+            retriever=retriever,
+            return_source_documents=True
+        ),
+        NARRATIVE: RetrievalQA.from_chain_type(
+            llm=llms[NARRATIVE],
+            chain_type="refine",
+            retriever=retriever, # or "map_reduce", "refine", "map_rerank"
+            return_source_documents=True,
+            verbose=True
+        ),
+    }
+
+class AnswerPipeline:
+    """Answers questionnaire questions against one vector index as a batch job
     
-    # Initialize Streamlit interface
-    st.title("Security Questionnaire Analysis")
+    Model calls made by the pipeline are scheduled behind interactive queries
+    and share the batch capacity round-robin with other jobs.
+    """
     
-    doc = Document()
-    style = doc.styles['Normal']
-    style.font.name = 'Calibri'
-    style.font.size = Pt(11)
+    def __init__(self, chains: Dict[str, RetrievalQA], index_version: str,
+                 batch_answerer: Optional[BatchAnswerer] = None,
+                 answer_cache: Optional[ApprovedAnswerCache] = None,
+                 job_id: Optional[str] = None,
+                 compression_stats: Optional[CompressionStats] = None,
+                 retriever=None,
+                 llms: Optional[Dict[str, ChatOpenAI]] = None,
+                 vector_store: Optional[FAISS] = None):
+        self.chains = chains
+        self.retriever = retriever
+        self.vector_store = vector_store
+        self.llms = llms
+        self.index_version = index_version
+        self.batch_answerer = batch_answerer
+        self.answer_cache = answer_cache
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.compression_stats = compression_stats or CompressionStats()
     
-    title = doc.add_heading('Security Questionnaire Analysis', 0)
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    def for_job(self, job_id: str) -> "AnswerPipeline":
+        """The same pipeline with its model calls scheduled as job `job_id`"""
+        pipeline = copy.copy(self)
+        pipeline.job_id = job_id
+        return pipeline
     
-    timestamp_para = doc.add_paragraph(f"Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    timestamp_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    doc.add_paragraph()
-
-    ratings = {
-        "IDEAL": "✅ Complete and detailed response with evidence",
-        "GOOD": "🟡 Adequate but could be improved",
-        "BAD": "❌ Incomplete or inadequate response"
-    }
-
-    with open(txt_output, 'w', encoding='utf-8') as f:
-        f.write("╔═══════════════════════════════════════════════════════════════════════════╗\n")
-        f.write("║                      Security Questionnaire Analysis                         ║\n")
-        f.write("║                                                                             ║\n")
-        f.write(f"║  Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}                                     ║\n")
-        f.write("╚═══════════════════════════════════════════════════════════════════════════════╝\n\n")
-
-        for section, questions in results['answers'].items():
-            section_name = questionnaire.sections.get(section, section)
-            
-            f.write("\n" + "=" * 80 + "\n")
-            f.write(f"{section_name.upper()}\n")
-            f.write("=" * 80 + "\n\n")
-            
-            st.header(section_name.upper())
-            doc.add_heading(section_name.upper(), level=1)
-            
-            for q_key, answer in questions.items():
-                full_question = questionnaire.questions[section][q_key]
-                
-                # Write to text file
-                f.write("📝 Question:\n")
-                f.write(f"{full_question}\n\n")
-                f.write("🔍 Answer:\n")
-                f.write(f"{answer['result'] if isinstance(answer, dict) else answer}\n\n")
-                
-                # Write to Word doc
-                q_para = doc.add_paragraph()
-                q_para.add_run("Question:\n").bold = True
-                q_para.add_run(full_question)
-                
-                a_para = doc.add_paragraph()
-                a_para.add_run("Answer:\n").bold = True
-                a_para.add_run(answer['result'] if isinstance(answer, dict) else answer)
-                
-                # Display in Streamlit
-                st.subheader("Question:")
-                st.write(full_question)
-                st.subheader("Answer:")
-                st.write(answer['result'] if isinstance(answer, dict) else answer)
-                
-                # Add rating buttons
-                col1, col2, col3 = st.columns(3)
-                rating = None
-                
-                with col1:
-                    if st.button("IDEAL", key=f"ideal_{section}_{q_key}"):
-                        rating = "IDEAL"
-                with col2:
-                    if st.button("GOOD", key=f"good_{section}_{q_key}"):
-                        rating = "GOOD"
-                with col3:
-                    if st.button("BAD", key=f"bad_{section}_{q_key}"):
-                        rating = "BAD"
-                
-                if rating:
-                    evaluation_text = f"📊 Evaluation:\nRating: {rating}\nJustification: {ratings[rating]}\n\n"
-                    f.write(evaluation_text)
-                    
-                    e_para = doc.add_paragraph()
-                    e_para.add_run("Evaluation:\n").bold = True
-                    e_para.add_run(f"Rating: {rating}\n")
-                    e_para.add_run(f"Justification: {ratings[rating]}")
-                
-                # Handle source documents
-                source_docs = []
-                if isinstance(answer, dict) and 'source_documents' in answer:
-                    source_docs = answer['source_documents']
-                
-                f.write("📚 Source Documents:\n")
-                if source_docs:
-                    for doc_ref in source_docs:
-                        source = os.path.basename(doc_ref.metadata.get('source', '[Document reference]'))
-                        page_num = doc_ref.metadata.get('page', 1)
-                        f.write(f"• {source} (Page {page_num})\n")
-                else:
-                    f.write("• [Document reference]\n")
-                
-                s_para = doc.add_paragraph()
-                s_para.add_run("Source Documents:\n").bold = True
-                if source_docs:
-                    for doc_ref in source_docs:
-                        source = os.path.basename(doc_ref.metadata.get('source', '[Document reference]'))
-                        page_num = doc_ref.metadata.get('page', 1)
-                        s_para.add_run(f"• {source} (Page {page_num})\n")
-                else:
-                    s_para.add_run("• [Document reference]")
-                
-                f.write("\n" + "_" * 80 + "\n\n")
-                doc.add_paragraph("_" * 80)
-                doc.add_paragraph()
-                
-                st.markdown("---")
-
-    doc.save(docx_output)
-    return txt_output, docx_output
-
-def main():
-    """Main function for RAG system"""
-    try:
-        docs_path = "/Users/dakshinsiva/final_RAG/docs"
-        documents = []
+    def plan(self, questions: Dict[str, str]) -> List[Dict[str, str]]:
+        """Split a section into the units of work answered together"""
+        if self.batch_answerer:
+            return group_questions(questions, BATCH_SIZE)
+        return [{key: question} for key, question in questions.items()]
+    
+    def answer_question(self, question: str, tier: str, report: RunReport) -> Dict:
+        """Answer a single question with the retrieval chain of its tier"""
+        started = time.perf_counter()
+        with get_openai_callback() as usage:
+            # Identical questions in flight at the same time share one chain call
+            answer = question_flights.do(
+                (self.index_version, normalize_question(question)),
+                generation_clients[tier].call,
+                self.chains[tier],
+                {"query": question}
+            )
+        elapsed = time.perf_counter() - started
+        answer = dict(answer, tier=tier, usage={
+            "prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens
+        })
+        report.record_question(elapsed)
+        report.record_tier(tier, elapsed, usage.prompt_tokens, usage.completion_tokens)
+        report.increment("individual_questions")
+        report.increment("answer_calls")
+        return answer
+    
+    def stuff_prompt(self, question: str, documents: List) -> str:
+        context = "\n\n".join(doc.page_content for doc in documents)
+        return STUFF_PROMPT.format(context=context, question=question)
+    
+    def retrieve_many(self, questions: List[str], k: int = 3) -> List[List]:
+        """Retrieve for several questions with one embedding call and one index search"""
+        vectors = np.array(embeddings.embed_documents(questions), dtype="float32")
+        _, ids = self.vector_store.index.search(vectors, k)
+        results = []
+        for question, row in zip(questions, ids):
+            documents = [
+                self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[int(i)])
+                for i in row if i >= 0
+            ]
+            if isinstance(self.retriever, ContextualCompressionRetriever):
+                documents = list(self.retriever.base_compressor.compress_documents(documents, question))
+            results.append(documents)
+        return results
+    
+    def answer_from_documents(self, question: str, documents: List, tier: Optional[str] = None) -> Dict:
+        """Answer a single question in one "stuff" pass over already retrieved documents"""
+        tier = tier or classify_question(question)
+        response = self.llms[tier].invoke(self.stuff_prompt(question, documents))
+        return {"query": question, "result": response.content, "source_documents": documents, "tier": tier}
+    
+    def _start_stream(self, question: str, tier: str):
+        """Retrieve and wait for the first chunk of the answer; returns (documents, stream, first text)"""
+        documents = self.retriever.invoke(question)
+        stream = self.llms[tier].stream(self.stuff_prompt(question, documents))
+        first = next((chunk.content for chunk in stream if chunk.content), "")
+        attempt = current_attempt()
+        if attempt is not None and attempt.expired():
+            # Another attempt won the hedge or the deadline passed; nobody will read this stream
+            stream.close()
+        return documents, stream, first
+    
+    def stream_answer(self, question: str, tier: Optional[str] = None):
+        """Answer a single question, yielding text chunks as the model produces them
+        
+        Always a single "stuff" pass over the retrieved context, since the
+        refine chain only produces its answer after its last step. The last
+        item is a dict with the full result, source documents, tier and the
+        time to first token and total time in seconds. Like answer_question it
+        goes through the tier's GenerationClient: retrieval and the first token
+        are hedged, and DeadlineExceeded is raised once the whole answer takes
+        longer than the tier's deadline.
+        """
+        tier = tier or classify_question(question)
+        client = generation_clients[tier]
+        started = time.perf_counter()
+        deadline_at = started + client.deadline
+        # Retrieval and the wait for the first token run under the tier's deadline
+        # and hedging; the rest of the stream is held to the same deadline below
+        documents, stream, first = client.call(self._start_stream, question, tier)
         
-        loaders = {
-            '.pdf': PyPDFLoader,
+        chunks = []
+        first_token = None
+        try:
+            for content in itertools.chain([first] if first else [], (chunk.content for chunk in stream)):
+                if not content:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                    time_to_first_token.add(first_token)
+                chunks.append(content)
+                yield content
+                if time.perf_counter() > deadline_at:
+                    raise DeadlineExceeded(f"{client.name} answer stream exceeded its {client.deadline:.0f}s deadline")
+        finally:
+            # Stops generation if the caller stopped reading or the deadline passed
+            stream.close()
+        
+        yield {
+            "query": question,
+            "result": "".join(chunks),
+            "source_documents": documents,
+            "tier": tier,
+            "time_to_first_token": first_token,
+            "elapsed": time.perf_counter() - started,
         }
+    
+    def answer_group(self, section: str, group: Dict[str, str], tiers: Dict[str, str], report: RunReport) -> Dict:
+        """Answer a group of questions, never raising; failures are stored per question"""
+        # Executor threads do not inherit the caller's context, so mark the priority here
+        with call_priority(BATCH, self.job_id):
+            return self._answer_group(section, group, tiers, report)
+    
+    def _answer_group(self, section: str, group: Dict[str, str], tiers: Dict[str, str], report: RunReport) -> Dict:
+        answers = {}
         
-        for filename in os.listdir(docs_path):
-            file_path = os.path.join(docs_path, filename)
-            file_extension = os.path.splitext(filename)[1].lower()
-            
-            if file_extension in loaders:
+        # Previously approved answers skip retrieval and generation entirely
+        if self.answer_cache:
+            for key, question in group.items():
+                started = time.perf_counter()
                 try:
-                    loader = loaders[file_extension](file_path)
-                    docs = loader.load()
-                    documents.extend(docs)
-                    logger.info(f"Successfully loaded {filename}")
+                    cached = self.answer_cache.lookup(question)
                 except Exception as e:
-                    logger.error(f"Error loading file {filename}: {str(e)}")
-                    continue
+                    logger.error(f"Answer cache lookup failed for question {key}: {str(e)}")
+                    cached = None
+                if cached:
+                    answers[key] = cached
+                    report.record_question(time.perf_counter() - started)
+                    report.increment("cache_hits")
         
-        if not documents:
-            raise ValueError("No documents were successfully loaded")
-            
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=100,
-            add_start_index=True,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        texts = text_splitter.split_documents(documents)
+        pending = {key: question for key, question in group.items() if key not in answers}
+        if len(pending) > 1 and self.batch_answerer:
+            started = time.perf_counter()
+            try:
+                with get_openai_callback() as usage:
+                    batched = generation_clients["batch"].call(self.batch_answerer.answer_group, pending)
+                elapsed = time.perf_counter() - started
+                report.increment("batched_groups")
+                report.increment("answer_calls")
+                report.increment("batched_questions", len(batched))
+                report.record_tier(SHORT, elapsed, usage.prompt_tokens, usage.completion_tokens, questions=len(batched))
+                for key in batched:
+                    batched[key]['tier'] = SHORT
+                    # Token usage of the shared call is split evenly across its questions
+                    batched[key]['usage'] = {
+                        "prompt_tokens": usage.prompt_tokens // len(batched),
+                        "completion_tokens": usage.completion_tokens // len(batched),
+                    }
+                    report.record_question(elapsed / len(batched))
+                answers.update(batched)
+            except Exception as e:
+                logger.error(f"Batched answering failed for {len(pending)} questions in section {section}: {str(e)}")
         
-        vector_store = FAISS.from_documents(
-            texts, 
-            OpenAIEmbeddings()
-        )
-        
-        retriever = vector_store.as_retriever(
-            search_type="similarity", 
-            search_kwargs={
-                "k": 3,
-                "include_metadata": True,
-                "score_threshold": 0.7
-            }
-        )
+        for key, question in pending.items():
+            if key in answers:
+                continue
+            tier = tiers.get(key, NARRATIVE)
+            try:
+                answers[key] = self.answer_question(question, tier, report)
+            except Exception as e:
+                logger.error(f"Error processing question {key} in section {section}: {str(e)}")
+                answers[key] = {"error": str(e)}
+                report.record_question(0.0, error=True)
         
-        llm = ChatOpenAI(temperature=0)
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="refine",
-            retriever=retriever, # or "map_reduce", "refine", "map_rerank"
-            return_source_documents=True,
-            verbose=True
-        )
+        return answers
+
+def compute_index_version(texts) -> str:
+    """Fingerprint of the indexed chunks, used to scope in-flight request sharing"""
+    digest = hashlib.sha1()
+    for text in texts:
+        digest.update(str(text.metadata.get('source')).encode('utf-8'))
+        digest.update(text.page_content.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def load_documents(docs_path: str = DOCS_PATH, progress: Optional[Callable[[str, int, int], None]] = None) -> List:
+    """Load the PDFs in docs_path and split them into indexable chunks
+    
+    progress, if given, is called as progress("files", parsed, total) after each file.
+    Files are identified by content hash (from the folder's upload manifest when
+    there is one), so a document parsed before is not parsed again.
+    """
+    documents = []
+    hashes = read_manifest(docs_path)
+    
+    loaders = {
+        '.pdf': PyPDFLoader,
+    }
+    
+    parse_cache = get_parse_cache() if PARSE_CACHE_ENABLED else None
+    filenames = [name for name in os.listdir(docs_path) if os.path.splitext(name)[1].lower() in loaders]
+    for parsed, filename in enumerate(filenames, 1):
+        file_path = os.path.join(docs_path, filename)
+        file_extension = os.path.splitext(filename)[1].lower()
         
-        questionnaire = SecurityQuestionnaire()
+        try:
+            sha256 = hashes.get(filename) or file_hash(file_path)
+            pages = parse_cache.get(sha256) if parse_cache else None
+            if pages is not None:
+                docs = [
+                    Document(page_content=page["page_content"], metadata=dict(page["metadata"], source=file_path))
+                    for page in pages
+                ]
+                logger.info(f"Reused parsed pages of {filename}")
+            else:
+                loader = loaders[file_extension](file_path)
+                docs = loader.load()
+                if parse_cache:
+                    parse_cache.put(sha256, [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs])
+                logger.info(f"Successfully loaded {filename}")
+            documents.extend(docs)
+        except Exception as e:
+            logger.error(f"Error loading file {filename}: {str(e)}")
+        if progress:
+            progress("files", parsed, len(filenames))
+    
+    if not documents:
+        raise ValueError("No documents were successfully loaded")
         
-        results = {
-            'questions': questionnaire.questions,
-            'sections': questionnaire.sections,
-            'answers': {}
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=800,
+        chunk_overlap=100,
+        add_start_index=True,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    return text_splitter.split_documents(documents)
+
+def build_vector_store(texts: List, job_id: str, progress: Optional[Callable[[str, int, int], None]] = None) -> FAISS:
+    """Embed the chunks into a FAISS index; progress is called as progress("chunks", embedded, total)"""
+    vectors = []
+    # Bulk embedding is batch work too, so interactive queries are served first
+    with call_priority(BATCH, job_id):
+        # Same batches embed_documents would send, one at a time so progress can be reported
+        for i in range(0, len(texts), BATCH_EMBEDDING_SIZE):
+            batch = texts[i:i + BATCH_EMBEDDING_SIZE]
+            vectors.extend(embeddings.embed_documents([text.page_content for text in batch]))
+            if progress:
+                progress("chunks", len(vectors), len(texts))
+    return FAISS.from_embeddings(
+        [(text.page_content, vector) for text, vector in zip(texts, vectors)],
+        embeddings,
+        metadatas=[text.metadata for text in texts]
+    )
+
+def build_pipeline(texts: List, job_id: str, progress: Optional[Callable[[str, int, int], None]] = None) -> AnswerPipeline:
+    """Index the chunks and assemble the answering pipeline for one run"""
+    return create_pipeline(build_vector_store(texts, job_id, progress), compute_index_version(texts), job_id)
+
+def create_pipeline(vector_store: FAISS, index_version: str, job_id: str) -> AnswerPipeline:
+    """Assemble the answering pipeline over an existing vector store"""
+    retriever = vector_store.as_retriever(
+        search_type="similarity", 
+        search_kwargs={
+            "k": 3,
+            "include_metadata": True,
+            "score_threshold": 0.7
         }
-        
+    )
+    
+    compression_stats = CompressionStats()
+    if COMPRESSION_ENABLED:
+        retriever = ContextualCompressionRetriever(
+            base_compressor=ExtractiveContextCompressor(
+                max_sentences=COMPRESSION_MAX_SENTENCES,
+                min_score=COMPRESSION_MIN_SCORE,
+                stats=compression_stats
+            ),
+            base_retriever=retriever
+        )
+    
+    llms = build_tier_llms()
+    chains = build_tier_chains(retriever, llms)
+    
+    batch_answerer = None
+    if BATCH_ANSWERING_ENABLED:
+        batch_answerer = BatchAnswerer(
+            retriever,
+            RateLimitedChatOpenAI(model=SHORT_ANSWER_MODEL, temperature=0, timeout=REQUEST_DEADLINE_SECONDS, max_retries=0),
+            max_context_tokens=MAX_TOKENS_PER_REQUEST - RESPONSE_TOKEN_LIMIT,
+            max_tokens_per_question=SHORT_ANSWER_TOKEN_LIMIT
+        )
+    
+    answer_cache = None
+    if ANSWER_CACHE_ENABLED:
+        answer_cache = ApprovedAnswerCache(
+            ResponseDatabase(),
+            embed_documents=embeddings.embed_documents,
+            embed_query=get_embedding,
+            threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD
+        )
+        try:
+            answer_cache.load()
+        except Exception as e:
+            logger.error(f"Could not load approved answers, continuing without the answer cache: {str(e)}")
+            answer_cache = None
+    
+    return AnswerPipeline(chains, index_version, batch_answerer, answer_cache,
+                          job_id=job_id, compression_stats=compression_stats, retriever=retriever, llms=llms,
+                          vector_store=vector_store)
+
+def process_rag_queries(questionnaire: SecurityQuestionnaire, docs_path: str = DOCS_PATH,
+                        run_id: Optional[str] = None, report: Optional[RunReport] = None,
+                        pipeline: Optional[AnswerPipeline] = None, store: Optional[ResultsStore] = None,
+                        progress: Optional[Callable[[str, int, int], None]] = None,
+                        checkpoints: Optional[CheckpointStore] = None):
+    """Answer a questionnaire, yielding each answer as soon as it completes
+    
+    Every item is a dict with run_id, section, question_key, question, answer,
+    sources, elapsed (seconds spent answering), group_elapsed (seconds
+    spent on the whole group the question was answered with; elapsed is its
+    even share), resumed (True when the answer came from the checkpoint of
+    an interrupted run) and record (the answer as written to the results
+    store). Items arrive in completion
+    order, not questionnaire order.
+    
+    progress, if given, is called as progress(stage, done, total) for the
+    stages "files" (parsed), "chunks" (embedded) and "questions" (answered).
+    """
+    run_id = run_id or uuid.uuid4().hex[:12]
+    report = report or RunReport()
+    logger.info(f"Questionnaire run {run_id} (pass --run-id {run_id} to resume it)")
+    
+    if pipeline is None:
+        pipeline = build_pipeline(load_documents(docs_path, progress), run_id, progress)
+    tiers = classify_questionnaire(questionnaire)
+    total = sum(len(questions) for questions in questionnaire.questions.values())
+    answered = 0
+    
+    def item(section, key, answer, group_elapsed, group_size=1, resumed=False):
+        # Questions answered together share the group's time, as they share its token usage
+        elapsed = group_elapsed / group_size
+        record = result_record(run_id, section, questionnaire.sections.get(section, section), key,
+                               questionnaire.questions[section][key], answer, elapsed)
+        return {
+            "run_id": run_id,
+            "section": section,
+            "question_key": key,
+            "question": questionnaire.questions[section][key],
+            "answer": answer,
+            "sources": record["sources"],
+            "elapsed": elapsed,
+            "group_elapsed": group_elapsed,
+            "resumed": resumed,
+            "record": record,
+        }
+    
+    def answer_group(section, group):
+        started = time.perf_counter()
+        answers = pipeline.answer_group(section, group, tiers[section], report)
+        return answers, time.perf_counter() - started
+    
+    store = store or ResultsStore()
+    store.start_run(run_id, questionnaire.sections)
+    
+    # Completed answers of a resumed run are reused; only the rest is answered
+    # (they were written to the results store when first answered)
+    checkpoints = checkpoints or CheckpointStore()
+    checkpoints.start_run(run_id, pipeline.index_version)
+    completed = checkpoints.completed_answers(run_id, questionnaire.questions)
+    resumed = sum(len(answers) for answers in completed.values())
+    if resumed:
+        logger.info(f"Resuming run {run_id} with {resumed} questions already answered")
+        report.increment("resumed_questions", resumed)
+    for section, answers in completed.items():
+        for key, answer in answers.items():
+            answered += 1
+            if progress:
+                progress("questions", answered, total)
+            yield item(section, key, answer, 0.0, resumed=True)
+    
+    # Answer groups concurrently, checkpointing each answer before handing it out
+    executor = ThreadPoolExecutor(max_workers=CONCURRENT_LIMIT)
+    futures = {}
+    try:
         for section, questions in questionnaire.questions.items():
-            results['answers'][section] = {}
-            for key, question in questions.items():
+            done = completed.get(section, {})
+            remaining = {key: question for key, question in questions.items() if key not in done}
+            for group in pipeline.plan(remaining):
+                futures[executor.submit(answer_group, section, group)] = section
+        for future in as_completed(futures):
+            section = futures[future]
+            answers, elapsed = future.result()
+            for key, answer in answers.items():
+                result = item(section, key, answer, elapsed, len(answers))
                 try:
-                    answer = qa_chain({"query": question})
-                    results['answers'][section][key] = answer
+                    checkpoints.save_answer(run_id, section, key, questionnaire.questions[section][key], answer)
+                    store.append(result["record"])
                 except Exception as e:
-                    logger.error(f"Error processing question {key} in section {section}: {str(e)}")
-                    results['answers'][section][key] = {"error": str(e)}
+                    logger.error(f"Could not save question {key} in section {section}: {str(e)}")
+                answered += 1
+                if progress:
+                    progress("questions", answered, total)
+                yield result
+    finally:
+        # A consumer that stops early should not keep paying for unanswered groups
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+    
+    checkpoints.finish_run(run_id)
+    report.finish()
+    if COMPRESSION_ENABLED:
+        report.add_section("compression", pipeline.compression_stats.summary())
+    if pipeline.answer_cache:
+        report.add_section("answer_cache", pipeline.answer_cache.summary())
+    report.add_section("coalesced_questions", question_flights.summary())
+    report.add_section("coalesced_embeddings", embedding_flights.summary())
+    report.add_section("rate_limiter", get_rate_limiter().summary())
+    report.add_section("generation_latency", {name: client.summary() for name, client in generation_clients.items()})
+    report.add_section("time_to_first_token", time_to_first_token.summary())
+    store.finish_run(run_id, report.as_dict())
+
+def main(run_id: Optional[str] = None):
+    """Main function for RAG system; pass the id of an interrupted run to resume it"""
+    try:
+        questionnaire = SecurityQuestionnaire()
+        report = RunReport()
+        run_id = run_id or uuid.uuid4().hex[:12]
+        store = ResultsStore()
+        
+        # Every answer is written to the results store as it completes and
+        # rendered into the report files in the background meanwhile
+        renderer = ReportRenderer(questionnaire)
+        try:
+            for item in process_rag_queries(questionnaire, run_id=run_id, report=report, store=store):
+                renderer.submit(item["record"])
+            paths = renderer.close()
+        finally:
+            # Partial reports of a failed run are deleted; its answers stay in the results store
+            renderer.abort()
+        report.log_summary()
         
-        txt_file, docx_file = write_formatted_results(results, questionnaire)
+        txt_file, docx_file = paths["txt"], paths["docx"]
         
         print(f"\nAnalysis complete!")
         print(f"Results saved to:")
+        print(f"- Results: {store.jsonl_path(run_id)} (run {run_id} in {store.directory}/results.db)")
         print(f"- Text file: {txt_file}")
         print(f"- Word document: {docx_file}")
         
@@ -420,4 +855,9 @@ def main():
         print(f"Error: {str(e)}")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Answer the security questionnaire against the loaded documents")
+    parser.add_argument("--run-id", help="resume the run with this id, skipping questions it already answered")
+    args = parser.parse_args()
+    main(run_id=args.run_id)